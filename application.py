@@ -17,7 +17,9 @@ from environment     import Environment
 from population      import Population
 from population      import ConsolePopulation
 from interpreter     import CLISPInterpreter
+from interpreter     import PythonInterpreter
 from configurator    import TextConfigurator
+from island          import Archipelago
 from parameter       import *
 from exception       import UnimplementedVirtualMethod
 
@@ -32,6 +34,7 @@ class Application(object):
         '_parameters','_execname',
         "_appname","_version","_date","_copyright","_url",
         '_environment','_configurator','_interpreter', '_population',
+        '_archipelago',
         ]
 
     def __init__(self, args):
@@ -46,11 +49,12 @@ class Application(object):
         self._url       = "http://charlemagne.sourceforge.net"        
         self.printTag()
         self._parameters = self._makeParameters()    
+        self._acceptArguments(args)
         self._environment = Environment()
-        self._interpreter = CLISPInterpreter()
+        self._interpreter = self._makeInterpreter()
         self._population = self._makePopulation()
         self._configurator = self._makeConfigurator()
-        self._acceptArguments(args)
+        self._archipelago = self._makeArchipelago()
         #print "i should be initializing the interpreter with the fitness env"
         #self._interpreter.initialize(self._environment.getFitnessEnvironment()) 
            
@@ -66,7 +70,12 @@ class Application(object):
         """Factory method for instantiating interpreter
         
         Override this to instantiate different Interpreter subclasses.
+        By default the Interpreter parameter chooses between CLISP and
+        native Python evaluation of programs.
         """
+        for param in self._parameters:
+            if param.getName() == "Interpreter" and param.getValue() == "PYTHON":
+                return PythonInterpreter()
         return CLISPInterpreter()
         
     def _makeParameters(self):
@@ -80,8 +89,10 @@ class Application(object):
                 TerminalsParameter(),
                 OneArgsParameter(),
                 TwoArgsParameter(),
+                DatasetCacheParameter(),
                 InputsFileParameter(), 
                 OutputsFileParameter(), 
+                InputSubsetSizeParameter(),
                 VocabularyFileParameter(), 
                 PopulationSizeParameter(), 
                 InitialDepthParameter(),
@@ -93,9 +104,18 @@ class Application(object):
                 SelectionMethodParameter(),
                 PrecisionParameter(),
                 ForceBestParameter(),
+                SimplifyParameter(),
                 FitnessEnvironmentFileParameter(),
                 GenerateOutputsParameter(),
-                DevianceCalculationParameter()
+                DevianceCalculationParameter(),
+                InterpreterParameter(),
+                FitnessEvaluationParameter(),
+                FitnessCacheParameter(),
+                RacingParameter(),
+                BreedingParameter(),
+                IslandsParameter(),
+                MigrationParameter(),
+                MigrantsParameter()
                ]
         
     def _makePopulation(self):
@@ -112,6 +132,13 @@ class Application(object):
         """
         return TextConfigurator(self._environment, self._parameters, self._interpreter)
         
+    def _makeArchipelago(self):
+        """Factory method for instantiating Archipelago
+
+        Override this in subclasses to instantiate Archipelago subclasses.
+        """
+        return Archipelago(self._environment, self._interpreter.__class__)
+        
     def _acceptArguments(self, args):
         for parameter in self._parameters:
             args = parameter.extractArg(args)
@@ -186,6 +213,9 @@ class Application(object):
     def getConfigurator(self):
         return self._configurator
         
+    def getArchipelago(self):
+        return self._archipelago
+        
     def help(self):
         help(type(self))
 
@@ -271,3 +271,64 @@
 
 
 
+;; returns the list of input variables INPUT1, INPUT2, ... INPUTn
+(defun input-variables (n)
+    (loop for i from 1 to n collect (intern (format nil "INPUT~D" i))))
+
+;; the resident fitness cases: a two dimensional array of input vectors, a
+;; vector of outputs, and a vector of the input variables they are bound to
+(defvar *fitness-inputs* (make-array '(0 0)))
+(defvar *fitness-outputs* (make-array 0))
+(defvar *fitness-variables* (vector))
+
+;; makes a list of input vectors and a list of outputs resident as the
+;; fitness cases.  outputs may be nil if a deviance function is to be used.
+;; returns the number of fitness cases
+(defun set-fitness-cases (inputs outputs)
+    (let ((variables (input-variables (length (car inputs)))))
+        (proclaim (cons 'special variables))
+        (setq *fitness-variables* (coerce variables 'vector))
+        (setq *fitness-inputs*
+            (make-array (list (length inputs) (length variables)) :initial-contents inputs))
+        (setq *fitness-outputs*
+            (make-array (length outputs) :initial-contents outputs))
+        (length inputs)))
+
+;; returns a list of the raw fitness and hits of a program over the resident
+;; fitness cases.  the program is compiled once, then run for every case.
+;; the deviance for each case is the distance from the corresponding
+;; output, or if deviance-function is not nil, the absolute value of
+;; (deviance-function program)
+(defun fitness-of (program precision &optional deviance-function)
+    (let ((f (handler-bind ((warning #'muffle-warning))
+                (compile nil (list 'lambda '()
+                                   (if deviance-function
+                                       (list deviance-function program)
+                                       program)))))
+          (n (length *fitness-variables*))
+          (rawfitness 0)
+          (hits 0))
+        (dotimes (i (array-dimension *fitness-inputs* 0))
+            (dotimes (k n)
+                (setf (symbol-value (svref *fitness-variables* k))
+                      (aref *fitness-inputs* i k)))
+            (let ((d (if deviance-function
+                         (abs (funcall f))
+                         (abs (- (aref *fitness-outputs* i) (funcall f))))))
+                (setq rawfitness (+ rawfitness d))
+                (if (<= d precision) (setq hits (+ hits 1)))))
+        (list rawfitness hits)))
+
+;; returns a list of (rawfitness hits depth) for each program in a list,
+;; calculated over the resident fitness cases.  programs which cause an
+;; arithmetic error get (NAUGHTY 0 depth)
+(defun batch-fitness (programs precision deviance-function)
+    (mapcar
+        #'(lambda (program)
+            (append
+                (handler-case
+                    (without-floating-point-underflow
+                        (fitness-of program precision deviance-function))
+                    (arithmetic-error () (list 'NAUGHTY 0)))
+                (list (depth program))))
+        programs))
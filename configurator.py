@@ -67,6 +67,7 @@ class TextConfigurator(Configurator):
             if param.getName() == "Lisp Environment File":
                 if param.isSet():
                     param.apply(self._interpreter)
+                    self._environment.setLispEnvironmentFile(param.getValue())
             else:
                 if param.isSet():
                     param.apply(self._environment)
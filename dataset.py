@@ -0,0 +1,147 @@
+"""
+Dataset module
+
+This module is part of Charlemagne
+Copyright (c) Robert Green 2002, 2003
+
+Charlemagne is distributed under the GNU General Public License.  See
+the file LICENSE.txt in the distribution for details.
+"""
+
+import os
+import re
+import tempfile
+import numpy
+from numpy.lib.format import open_memmap
+
+# the number of bytes of a file parsed at a time when building a cache
+BLOCK_BYTES = 16 * 1024 * 1024
+
+def readMatrix(filename):
+    """Read a comma delimited (CSV) file of numbers into a float64 matrix
+
+    Each non-empty line is a row of the matrix.  The whole file is parsed
+    in bulk into one contiguous array, so indexing or iterating over the
+    matrix gives row views rather than lists.  Raises ValueError if a line
+    has anything other than numbers, or a different number of them than
+    the first line.
+    """
+    file = open(filename, 'r')
+    try:
+        lines = filter(None, file.read().splitlines())
+    finally:
+        file.close()
+    if len(lines) == 0:
+        return numpy.zeros((0, 0))
+    return _parse(filename, lines, len(lines[0].split(',')))
+
+def _parse(filename, lines, columns):
+    commas = columns - 1
+    for line in lines:
+        if line.count(',') <> commas:
+            raise ValueError("%s is not a matrix of %d numbers per line" %
+                             (filename, columns))
+    matrix = numpy.fromstring(",".join(lines), sep=',')
+    if matrix.size <> len(lines) * columns:
+        raise ValueError("%s is not a matrix of %d numbers per line" %
+                         (filename, columns))
+    return matrix.reshape((len(lines), columns))
+
+def _blocks(filename):
+    """Generate the non-empty lines of a file as lists of about BLOCK_BYTES"""
+    file = open(filename, 'r')
+    try:
+        while 1:
+            lines = file.readlines(BLOCK_BYTES)
+            if len(lines) == 0:
+                break
+            yield filter(None, "".join(lines).splitlines())
+    finally:
+        file.close()
+
+def cachePath(filename):
+    """Return the path of the binary cache of a CSV file
+
+    The cache sits beside the file, and its name records the size and
+    modification time of the file it was made from, so a cache made before
+    the file changed is never used.
+    """
+    status = os.stat(filename)
+    return "%s.%d-%d.npy" % (filename, status.st_size,
+                             int(status.st_mtime * 1000000))
+
+def readCachedMatrix(filename):
+    """Read a CSV file of numbers into a float64 matrix, by way of a binary cache
+
+    The first time a file is read it is parsed into the binary cache given
+    by cachePath.  Later reads, in this run or others, memory map the cache
+    read only, so they take almost no time and concurrent runs share the
+    same pages.  The cache is built a block at a time, so files bigger than
+    memory can be used.  If the cache can't be written, the file is read
+    with readMatrix.
+    """
+    path = cachePath(filename)
+    if os.path.exists(path):
+        try:
+            return numpy.load(path, mmap_mode='r')
+        except (IOError, ValueError):
+            pass
+    try:
+        built = _buildCache(filename, path)
+    except (IOError, OSError):
+        return readMatrix(filename)
+    if not built:
+        return numpy.zeros((0, 0))
+    return numpy.load(path, mmap_mode='r')
+
+def _buildCache(filename, path):
+    """Write the binary cache of a CSV file, a block at a time
+
+    The file is read twice, once to count the rows and once to parse them
+    into the memory mapped cache, so the file need not fit in memory.
+    Returns false if the file is empty and there is nothing to cache.
+    """
+    rows = 0 ; columns = None
+    for lines in _blocks(filename):
+        if columns is None and len(lines) > 0:
+            columns = len(lines[0].split(','))
+        rows = rows + len(lines)
+    if rows == 0:
+        return 0
+    # write under a temporary name and rename, so that concurrent runs
+    # never see a partly written cache
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temporary = tempfile.mkstemp(".npy", ".dataset-", directory)
+    os.close(fd)
+    try:
+        matrix = open_memmap(temporary, 'w+', numpy.float64, (rows, columns))
+        row = 0
+        for lines in _blocks(filename):
+            if len(lines) == 0:
+                continue
+            if row + len(lines) > rows:
+                raise ValueError(filename + " changed while it was being read")
+            matrix[row:row + len(lines)] = _parse(filename, lines, columns)
+            row = row + len(lines)
+        if row <> rows:
+            raise ValueError(filename + " changed while it was being read")
+        matrix.flush()
+        del matrix
+        # mkstemp makes the file private, but runs under other accounts
+        # should be able to map the cache too
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(temporary, 0666 & ~umask)
+        os.rename(temporary, path)
+    except:
+        os.remove(temporary)
+        raise
+    # caches of earlier versions of the file are no use any more
+    stale = re.compile(re.escape(os.path.basename(filename)) + r"\.\d+-\d+\.npy$")
+    for name in os.listdir(directory):
+        if stale.match(name) and name <> os.path.basename(path):
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+    return 1
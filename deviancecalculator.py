@@ -53,6 +53,10 @@ class InputDevianceCalculator(DevianceCalculator):
         """
         return self._input
 
+    def setInput(self, input):
+        """Set the input set"""
+        self._input = input
+
     def calculate(self, p, i):
         """Calculate the deviance of a program on a given input
         
@@ -60,6 +64,23 @@ class InputDevianceCalculator(DevianceCalculator):
         """
         raise UnimplementedVirtualMethod
 
+    def calculateFitness(self, p, precision):
+        """Calculate the raw fitness and hits of a program over the whole input set
+
+        The raw fitness is the sum of the deviances, and hits the number of
+        deviances no greater than precision.  Override this in subclasses
+        which can do better than calculating each deviance in turn.
+
+        WARNING: This can raise NaughtyException which should be
+        dealt with in the caller.
+        """
+        rawfitness = 0 ; hits = 0
+        for i in range(len(self._input)):
+            d = self.calculate(p, i)
+            rawfitness = rawfitness + d
+            hits = hits + (d <= precision)
+        return (rawfitness, hits)
+
 class OutputDevianceCalculator(InputDevianceCalculator):
     """A DevianceCalculator which calculates deviance based on the input and output set.
 
@@ -96,6 +117,18 @@ class OutputDevianceCalculator(InputDevianceCalculator):
         y = self._interpreter.evaluate(p.lisp, self._input[i])
         return abs(self._output[i] - float(y))
 
+    def calculateFitness(self, p, precision):
+        """Calculate the raw fitness and hits of a program over the whole input set
+
+        The interpreter compiles the program once and runs it on all of
+        the resident inputs and outputs.
+
+        WARNING: This can raise NaughtyException which should be
+        dealt with in the caller.
+        """
+        return self._interpreter.fitnessOf(p.lisp, self._input, self._output,
+                                           None, precision)
+
 class LispFunctionDevianceCalculator(InputDevianceCalculator):
     """A DevianceCalculator which calculates deviance by evaluating a lisp expression.
 
@@ -110,6 +143,13 @@ class LispFunctionDevianceCalculator(InputDevianceCalculator):
         self._input = input
         self._expression = expression
 
+    def getExpression(self):
+        """Return the name of the lisp function used to calculate deviance
+
+        ...
+        """
+        return self._expression
+
     def calculate(self, p, i):
         """Calculate the deviance the specified program on the specified input index.
 
@@ -120,3 +160,15 @@ class LispFunctionDevianceCalculator(InputDevianceCalculator):
         deviance = abs(float(self._interpreter.evaluate(expr, self._input[i])))
 
         return deviance
+
+    def calculateFitness(self, p, precision):
+        """Calculate the raw fitness and hits of a program over the whole input set
+
+        The interpreter compiles the call to the lisp function once and runs
+        it on all of the resident inputs.
+
+        WARNING: This can raise NaughtyException which should be
+        dealt with in the caller.
+        """
+        return self._interpreter.fitnessOf(p.lisp, self._input, None,
+                                           self._expression, precision)
@@ -8,14 +8,31 @@ Charlemagne is distributed under the GNU General Public License.  See
 the file LICENSE.txt in the distribution for details.
 """
 
+import random
 import string
-
+import numpy
+
+from  dataset            import  readMatrix
+from  dataset            import  readCachedMatrix
+from  interpreter        import  CLISPInterpreter
+from  interpreter        import  InterpreterPool
+from  remote             import  RemoteInterpreterPool
+from  deviancecalculator import  InputDevianceCalculator
 from  deviancecalculator import  OutputDevianceCalculator
 from  deviancecalculator import  LispFunctionDevianceCalculator
 from  outputgenerator    import  LispExpressionOutputGenerator
 from  fitnessevaluator   import  FitnessEvaluator
+from  fitnessevaluator   import  VectorizedFitnessEvaluator
+from  fitnessevaluator   import  BatchFitnessEvaluator
+from  fitnessevaluator   import  CompiledFitnessEvaluator
+from  fitnessevaluator   import  SharedSubtreeFitnessEvaluator
+from  fitnessevaluator   import  ChunkedFitnessEvaluator
+from  subtreecache       import  SubtreeCache
+from  fitnesscache       import  FitnessCache
 from  programselector    import  FitnessProportionateProgramSelector
 from  programselector    import  TournamentProgramSelector
+from  programselector    import  RouletteWheelSelector
+from  programselector    import  StochasticUniversalSelector
 
 class Environment(object):
     """An environment in which genetic programming occurs
@@ -27,9 +44,13 @@ class Environment(object):
             '_name','_populationsize','_initialprogramdepth','_maxprogramdepth',
             '_crossoverp','_cscrossoverp','_replicatep','_mutatep',
             '_fitnessenvironment','_fitnessevaluator','_programselector',
-            '_deviancecalculator','_outputgenerator',
-            '_forcebest','_precision',
-            '_input','_output',
+            '_deviancecalculator','_outputgenerator','_fitnessevaluation',
+            '_poolsize','_workers','_subtreebudget','_blocksize',
+            '_lispenvironmentfile','_fitnesscachesize',
+            '_forcebest','_simplification','_datasetcache','_racing',
+            '_precision','_breeding','_replacementsize',
+            '_islands','_migrationtopology','_migrationinterval','_migrants',
+            '_input','_output','_inputsubsetsize','_fitnesscases',
             '_terminals','_oneargs','_twoargs',
             '_interpreter'
             ]
@@ -48,10 +69,28 @@ class Environment(object):
         self._fitnessevaluator          = None
         self._deviancecalculator        = None
         self._outputgenerator           = None
+        self._fitnessevaluation         = "STANDARD"
+        self._poolsize                  = None
+        self._workers                   = []
+        self._subtreebudget             = None
+        self._blocksize                 = None
+        self._lispenvironmentfile       = None
+        self._fitnesscachesize          = 0
         self._forcebest                 = None
+        self._simplification            = 0
+        self._datasetcache              = 0
+        self._racing                    = 0
         self._precision                 = None
+        self._breeding                  = "GENERATIONAL"
+        self._replacementsize           = None
+        self._islands                   = 1
+        self._migrationtopology         = "RING"
+        self._migrationinterval         = 10
+        self._migrants                  = 1
         self._input                     = None
         self._output                    = None
+        self._inputsubsetsize           = None
+        self._fitnesscases              = None
         self._terminals                 = []
         self._oneargs                   = []
         self._twoargs                   = []
@@ -69,21 +108,85 @@ class Environment(object):
                 self._outputgenerator.setInterpreter(interpreter)
             self._output = self._outputgenerator.generate()
             self._deviancecalculator.setOutput(self._output)
-        self._fitnessevaluator = FitnessEvaluator(self._input,
-                                                  self._output,
-                                                  self._interpreter,
-                                                  self._deviancecalculator)
+        self._fitnessevaluator = self._makeFitnessEvaluator()
+        if self._fitnesscachesize > 0:
+            self._fitnessevaluator.setCache(FitnessCache(self._fitnesscachesize))
+
+    def _makeFitnessEvaluator(self):
+        """Factory method for instantiating the FitnessEvaluator
+
+        The fitness evaluation method decides which FitnessEvaluator
+        subclass is used.  Vectorized, shared subtree and chunked evaluation
+        are only possible with output deviance calculation, batch, pooled
+        and remote evaluation with output or lisp function deviance
+        calculation.
+        """
+        calculatorclass = self._deviancecalculator.__class__
+        interpreter = self._interpreter
+        if self._fitnessevaluation == "VECTORIZED" and \
+           calculatorclass == OutputDevianceCalculator:
+            evaluatorclass = VectorizedFitnessEvaluator
+        elif self._fitnessevaluation == "SHARED" and \
+             calculatorclass == OutputDevianceCalculator:
+            evaluatorclass = SharedSubtreeFitnessEvaluator
+        elif self._fitnessevaluation == "CHUNKED" and \
+             calculatorclass == OutputDevianceCalculator:
+            evaluatorclass = ChunkedFitnessEvaluator
+        elif self._fitnessevaluation in ("BATCH", "POOL", "REMOTE") and \
+             calculatorclass in (OutputDevianceCalculator,
+                                 LispFunctionDevianceCalculator):
+            evaluatorclass = BatchFitnessEvaluator
+            if self._fitnessevaluation == "POOL":
+                interpreter = self._makeInterpreterPool()
+            elif self._fitnessevaluation == "REMOTE":
+                interpreter = self._makeRemoteInterpreterPool()
+        elif self._fitnessevaluation == "COMPILED":
+            evaluatorclass = CompiledFitnessEvaluator
+        else:
+            evaluatorclass = FitnessEvaluator
+        evaluator = evaluatorclass(self._input,
+                                   self._output,
+                                   interpreter,
+                                   self._deviancecalculator)
+        if evaluatorclass == SharedSubtreeFitnessEvaluator:
+            evaluator.setSubtreeCache(SubtreeCache(self._subtreebudget))
+        elif evaluatorclass == ChunkedFitnessEvaluator:
+            evaluator.setBlockSize(self._blocksize)
+        return evaluator
+
+    def _makeInterpreterPool(self):
+        """Factory method for instantiating the InterpreterPool for pooled evaluation
+
+        The pool interpreters are CLISPInterpreters whatever the main
+        interpreter is: PythonInterpreters would evaluate in threads of this
+        process, one at a time.  They are loaded with the lisp environment
+        file if there is one.
+        """
+        pool = InterpreterPool(self._poolsize, CLISPInterpreter)
+        if self._lispenvironmentfile <> None:
+            pool.broadcast('(load "' + self._lispenvironmentfile + '")')
+        return pool
+
+    def _makeRemoteInterpreterPool(self):
+        """Factory method for instantiating the RemoteInterpreterPool for remote evaluation
+
+        The workers are loaded with the lisp environment file if there is
+        one, so it must be at the same path on every worker's machine.
+        """
+        pool = RemoteInterpreterPool(self._workers)
+        if self._lispenvironmentfile <> None:
+            pool.loadFile(self._lispenvironmentfile)
+        return pool
 
     def _readPutsFromFile(self, putsfile):
-        put = []
-        file = open(putsfile, 'r')
-        for line in file.readlines():
-            if len(line[:-1]) > 0:
-                vector = string.split(line[:-1],',')
-                for i in range(len(vector)):
-                    vector[i] = float(vector[i])
-                put.append(vector)
-        return put
+        """Read an inputs or outputs file into a float64 matrix, one row per line
+
+        With the dataset cache, the matrix is memory mapped from a binary
+        cache beside the file.
+        """
+        if self._datasetcache:
+            return readCachedMatrix(putsfile)
+        return readMatrix(putsfile)
 
     #def _calculateOutputsFromExpression(self):
     #    interpreter = CLISPInterpreter(self._fitnessenvironment)
@@ -336,6 +439,17 @@ class Environment(object):
     
     def useLispEnvironmentFile(self, filename):
         self._interpreter.evaluate('(load "' + filename + '")')
+
+    def getLispEnvironmentFile(self):
+        """Returns the lisp environment file, or None"""
+        return self._lispenvironmentfile
+
+    def setLispEnvironmentFile(self, filename):
+        """Set the lisp environment file the interpreter has been initialized with
+
+        This is used to initialize any additional interpreters in the same way.
+        """
+        self._lispenvironmentfile = filename
         
 #     def getFitnessEnvironment(self):
 #         """Return the fitness environment file filename
@@ -377,6 +491,71 @@ class Environment(object):
 
     forcebest = property(getForceBest)
 
+    def getSimplification(self):
+        """Returns true if bred programs are simplified"""
+        return self._simplification
+
+    def setSimplification(self, simplification):
+        """Set whether bred programs are simplified
+
+        Simplified programs have constant subtrees folded and safe
+        identities applied before their depth is checked.
+        """
+        self._simplification = simplification
+
+    simplification = property(getSimplification, setSimplification)
+
+    def getDatasetCache(self):
+        """Returns true if inputs and outputs files are read by way of a binary cache"""
+        return self._datasetcache
+
+    def setDatasetCache(self, datasetcache):
+        """Set whether inputs and outputs files are read by way of a binary cache
+
+        The cache is written beside each file the first time it is read,
+        and memory mapped read only after that.  This must be set before
+        the files are read.
+        """
+        self._datasetcache = datasetcache
+
+    datasetcache = property(getDatasetCache, setDatasetCache)
+
+    def getRacing(self):
+        """Returns true if evaluation of hopeless programs stops early"""
+        return self._racing
+
+    def setRacing(self, racing):
+        """Set whether evaluation of hopeless programs stops early
+
+        In racing mode a program's evaluation stops as soon as its raw
+        fitness is known to be worse than a threshold.  In steady-state
+        breeding the threshold is the program it would replace, and a
+        program which loses is dropped.  In generational breeding it is
+        the RACING_PERCENTILE percentile of the last generation; a program
+        which passes it keeps a raw fitness which is only a lower bound,
+        and an adjusted fitness of 0.  Only the STANDARD and CHUNKED
+        fitness evaluation methods race.
+        """
+        self._racing = racing
+
+    racing = property(getRacing, setRacing)
+
+    def getFitnessCacheSize(self):
+        """Returns the number of Program fitnesses which are cached
+
+        If its zero, the feature is effectively disabled
+        """
+        return self._fitnesscachesize
+
+    def setFitnessCacheSize(self, size):
+        """Set the number of Program fitnesses which are cached
+
+        If its zero, the feature is effectively disabled
+        """
+        self._fitnesscachesize = size
+
+    fitnesscachesize = property(getFitnessCacheSize, setFitnessCacheSize)
+
     def getPrecision(self):
         """Returns the numeric value of how close a Program answer must be to be considered a hit
         """
@@ -412,7 +591,8 @@ class Environment(object):
         """Use the input set contained in the specified file
 
         The file must be in ASCII comma delimited (CSV) format.  One input vector
-        per line, with each dimension seperated by commas.
+        per line, with each dimension seperated by commas.  The input set is
+        a float64 matrix, whose rows are the input vectors.
         """
         self._input = self._readPutsFromFile(inputsfile)
 
@@ -420,12 +600,10 @@ class Environment(object):
         """Use the output set contained in the specified file
 
         The file must be an ASCII file with one line per output.  The can
-        only be one output per line.
+        only be one output per line.  The output set is a float64 vector.
         """
         outputvectors = self._readPutsFromFile(outputsfile)
-        self._output = []
-        for vector in outputvectors:
-            self._output.append(vector[0])
+        self._output = outputvectors[:,:1].ravel()
 
     def useFitnessProportionateSelection(self, fitnessDependence):
         """Use a fitness proportionate selection method
@@ -443,6 +621,23 @@ class Environment(object):
         """
         self._programselector = TournamentProgramSelector(size)
 
+    def useRouletteWheelSelection(self):
+        """Use a roulette wheel selection method
+
+        Program selection for genetic operations will be proportional
+        to adjusted fitness.
+        """
+        self._programselector = RouletteWheelSelector()
+
+    def useStochasticUniversalSelection(self):
+        """Use a stochastic universal sampling selection method
+
+        Program selection for genetic operations will be proportional
+        to adjusted fitness, with the parents for a generation drawn
+        together in one pass.
+        """
+        self._programselector = StochasticUniversalSelector()
+
     def useLispExpressionOutputGeneration(self, expr):
         """Use the specified lisp expression to generate outputs
 
@@ -490,12 +685,229 @@ class Environment(object):
         self._deviancecalculator = \
             getattr(__import__(module), classname)(self._input, self._interpreter)
 
+    def useStandardFitnessEvaluation(self):
+        """Evaluate fitness one input at a time
+
+        Each Program is evaluated on each input by the deviance calculator.
+        """
+        self._fitnessevaluation = "STANDARD"
+
+    def useVectorizedFitnessEvaluation(self):
+        """Evaluate fitness over all of the inputs at once
+
+        Each Program is compiled into array operations over the whole input
+        set.  This only applies to output deviance calculation.
+        """
+        self._fitnessevaluation = "VECTORIZED"
+
+    def useSharedSubtreeFitnessEvaluation(self, budget):
+        """Evaluate fitness over all of the inputs at once, sharing common subtrees
+
+        As vectorized evaluation, but each distinct subtree in a generation
+        is evaluated only once.  Its results are cached in at most budget
+        bytes.  This only applies to output deviance calculation.
+        """
+        self._fitnessevaluation = "SHARED"
+        self._subtreebudget = budget
+
+    def useChunkedFitnessEvaluation(self, blocksize):
+        """Evaluate fitness over blocks of inputs at a time
+
+        As vectorized evaluation, but the input set is streamed through
+        blocksize rows at a time, so memory use stays bounded for input sets
+        too big to hold, such as memory mapped ones.  This only applies to
+        output deviance calculation.
+        """
+        self._fitnessevaluation = "CHUNKED"
+        self._blocksize = blocksize
+
+    def useBatchFitnessEvaluation(self):
+        """Evaluate fitness of a whole generation in one interpreter query
+
+        All of the Programs of a generation and the input set are sent to
+        the interpreter together.  This applies to output and lisp function
+        deviance calculation.
+        """
+        self._fitnessevaluation = "BATCH"
+
+    def useCompiledFitnessEvaluation(self):
+        """Evaluate fitness of each Program over all of the inputs in one go
+
+        The interpreter keeps the inputs and outputs resident, compiles
+        each Program once and loops over the inputs itself.
+        """
+        self._fitnessevaluation = "COMPILED"
+
+    def usePooledFitnessEvaluation(self, size):
+        """Evaluate fitness of a whole generation across a pool of interpreters
+
+        The Programs of a generation are divided between the specified
+        number of interpreter processes which evaluate them in parallel.
+        This applies to output and lisp function deviance calculation.
+        """
+        self._fitnessevaluation = "POOL"
+        self._poolsize = size
+
+    def useRemoteFitnessEvaluation(self, workers):
+        """Evaluate fitness of a whole generation across remote workers
+
+        workers is a list of host:port addresses of workers started with
+        remote.py.  The Programs of a generation are divided between them
+        and evaluated in parallel.  This applies to output and lisp
+        function deviance calculation.
+        """
+        self._fitnessevaluation = "REMOTE"
+        self._workers = workers
+
+    def useGenerationalBreeding(self):
+        """Breed a whole new generation before evaluating any of it"""
+        self._breeding = "GENERATIONAL"
+
+    def useSteadyStateBreeding(self, size):
+        """Insert offspring into the population as soon as they are bred
+
+        Each offspring is evaluated on its own and replaces the loser of an
+        inverse tournament of the specified size.
+        """
+        self._breeding = "STEADY-STATE"
+        self._replacementsize = size
+
+    def getBreeding(self):
+        """Returns the breeding method, GENERATIONAL or STEADY-STATE"""
+        return self._breeding
+
+    def getReplacementTournamentSize(self):
+        """Returns the size of the inverse tournament for steady state breeding"""
+        return self._replacementsize
+
+    def getIslands(self):
+        """Returns the number of islands the population is bred on"""
+        return self._islands
+
+    def setIslands(self, islands):
+        """Set the number of islands the population is bred on
+
+        Each island is a separate population, bred in its own process.
+        """
+        self._islands = islands
+
+    islands = property(getIslands, setIslands)
+
+    def useRingMigration(self, interval):
+        """Migrate from each island to the next every interval generations"""
+        self._migrationtopology = "RING"
+        self._migrationinterval = interval
+
+    def useRandomMigration(self, interval):
+        """Migrate from each island to a random island every interval generations"""
+        self._migrationtopology = "RANDOM"
+        self._migrationinterval = interval
+
+    def getMigrationTopology(self):
+        """Returns the migration topology, RING or RANDOM"""
+        return self._migrationtopology
+
+    def getMigrationInterval(self):
+        """Returns the number of generations between migrations"""
+        return self._migrationinterval
+
+    def getMigrants(self):
+        """Returns the number of programs each island sends per migration"""
+        return self._migrants
+
+    def setMigrants(self, migrants):
+        """Set the number of programs each island sends per migration"""
+        self._migrants = migrants
+
+    migrants = property(getMigrants, setMigrants)
+
     def inputCount(self):
         """Returns the number of inputs in the input list
         
         ...
         """
         return len(self._input)
+
+    def getInputSubsetSize(self):
+        """Returns the size of the random subset of inputs fitness is evaluated on
+
+        None means fitness is evaluated on every input.
+        """
+        return self._inputsubsetsize
+
+    def setInputSubsetSize(self, inputsubsetsize):
+        """Evaluate fitness on a random subset of the inputs of the specified size
+
+        A new subset is drawn each generation by refreshInputSubset.
+        """
+        self._inputsubsetsize = inputsubsetsize
+
+    inputsubsetsize = property(getInputSubsetSize, setInputSubsetSize)
+
+    def refreshInputSubset(self):
+        """Draw a new random subset of the inputs to evaluate fitness on
+
+        The FitnessEvaluator and DevianceCalculator are given the chosen
+        inputs and their outputs.  Returns false, and does nothing, if no
+        subset smaller than the input set has been asked for.
+        """
+        size = self._inputsubsetsize
+        if size is None or size >= len(self._input):
+            return 0
+        # sample without building a permutation of the whole input set
+        indexes = numpy.sort(numpy.array(random.sample(xrange(len(self._input)),
+                                                       size)))
+        input = self._subset(self._input, indexes)
+        output = self._subset(self._output, indexes)
+        self._fitnesscases = (input, output)
+        self._setFitnessCases(input, output)
+        return 1
+
+    def _subset(self, put, indexes):
+        if put is None:
+            return None
+        if isinstance(put, numpy.ndarray):
+            return put[indexes]
+        return [put[i] for i in indexes]
+
+    def _setFitnessCases(self, input, output):
+        self._fitnessevaluator.setInput(input)
+        self._fitnessevaluator.setOutput(output)
+        if isinstance(self._deviancecalculator, InputDevianceCalculator):
+            self._deviancecalculator.setInput(input)
+        if isinstance(self._deviancecalculator, OutputDevianceCalculator):
+            self._deviancecalculator.setOutput(output)
+
+    def fitnessCaseCount(self):
+        """Returns the number of inputs fitness is currently evaluated on
+
+        This is the size of the input subset if one is in use.
+        """
+        if self._fitnesscases is None:
+            return self.inputCount()
+        return len(self._fitnesscases[0])
+
+    def evaluateOnAllInputs(self, p):
+        """Evaluate a program on every input, even if a subset is in use
+
+        The program is evaluated in full even in racing mode.
+        """
+        if self._fitnesscases is None:
+            bound = self._fitnessevaluator.getBound()
+            self._fitnessevaluator.setBound(None)
+            try:
+                self._fitnessevaluator.evaluate(p)
+            finally:
+                self._fitnessevaluator.setBound(bound)
+            return
+        bound = self._fitnessevaluator.getBound()
+        self._setFitnessCases(self._input, self._output)
+        self._fitnessevaluator.setBound(None)
+        try:
+            self._fitnessevaluator.evaluate(p)
+        finally:
+            self._setFitnessCases(self._fitnesscases[0], self._fitnesscases[1])
+            self._fitnessevaluator.setBound(bound)
         
     def help(self):
         help(type(self))
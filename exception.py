@@ -22,3 +22,9 @@ class UnimplementedVirtualMethod(Exception):
     
 class BadParameterException(Exception):
     pass
+
+class UnsupportedExpression(Exception):
+    pass
+
+class IslandException(Exception):
+    pass
@@ -0,0 +1,347 @@
+"""
+Expression module
+
+This module is part of Charlemagne
+Copyright (c) Robert Green 2002, 2003
+
+Charlemagne is distributed under the GNU General Public License.  See
+the file LICENSE.txt in the distribution for details.
+"""
+
+import math
+import string
+import numpy
+
+from exception import NaughtyExpression
+from exception import UnsupportedExpression
+
+# the largest single-float.  CLISP reads program constants as single-floats,
+# so anything beyond this would have signalled floating-point-overflow.
+FLOAT_LIMIT = 3.4028234663852886e+38
+
+# default value for safe functions (safe-default in charlemagne.lsp)
+SAFE_DEFAULT = 0
+
+_exponentmarkers = string.maketrans("dDfFsSlLE", "eeeeeeeee")
+
+def tokenize(lisp):
+    """Split a lisp expression into a list of tokens"""
+    return lisp.replace("(", " ( ").replace(")", " ) ").split()
+
+def atom(token):
+    """Convert a token to an atom
+
+    Numbers become ints or floats (ratios are converted to floats), anything
+    else is a symbol and is upper cased as the lisp reader would.
+    """
+    if token[0] in "0123456789+-.":
+        try:
+            return int(token)
+        except ValueError:
+            pass
+        try:
+            return float(string.translate(token, _exponentmarkers))
+        except ValueError:
+            pass
+        ratio = token.split('/')
+        if len(ratio) == 2:
+            try:
+                return float(int(ratio[0])) / int(ratio[1])
+            except (ValueError, ZeroDivisionError):
+                pass
+    if token[0] in "'\"#|;`,":
+        raise UnsupportedExpression
+    return token.upper()
+
+def parse(lisp):
+    """Parse a lisp expression into nested tuples
+
+    Lists become tuples and atoms are converted with atom().  Raises
+    UnsupportedExpression for anything this reader does not understand
+    (quoting, strings, reader macros, unbalanced parentheses).
+    """
+    tokens = tokenize(lisp)
+    if len(tokens) == 0:
+        raise UnsupportedExpression
+    stack = [[]]
+    for token in tokens:
+        if token == "(":
+            stack.append([])
+        elif token == ")":
+            if len(stack) == 1:
+                raise UnsupportedExpression
+            l = tuple(stack.pop())
+            stack[-1].append(l)
+        else:
+            stack[-1].append(atom(token))
+    if len(stack) <> 1 or len(stack[0]) <> 1:
+        raise UnsupportedExpression
+    return stack[0][0]
+
+def unparse(expr):
+    """Convert a parsed expression back into a lisp string"""
+    if type(expr) == tuple:
+        return "(" + string.join(map(unparse, expr), " ") + ")"
+    elif type(expr) == float:
+        return repr(expr)
+    else:
+        return str(expr)
+
+def depth(expr):
+    """Return the depth of a parsed expression, as depth in charlemagne.lsp"""
+    if type(expr) <> tuple or len(expr) == 0:
+        return 0
+    return 1 + max(map(depth, expr))
+
+def flatCount(expr):
+    """Return the number of atoms at all layers of a parsed expression, as flat-count in charlemagne.lsp"""
+    if type(expr) <> tuple:
+        return 1
+    n = 0
+    for e in expr:
+        if type(e) == tuple and len(e) > 0:
+            n = n + flatCount(e)
+        else:
+            n = n + 1
+    return n
+
+def checked(x):
+    """Return x, raising NaughtyExpression if it is out of single-float range"""
+    if not (-FLOAT_LIMIT <= x <= FLOAT_LIMIT):
+        raise NaughtyExpression
+    return x
+
+def protectedDivide(numerator, denominator):
+    """Safe division, as % in charlemagne.lsp"""
+    if checked(abs(denominator) * 10000000000) >= 1:
+        return float(numerator) / denominator
+    return SAFE_DEFAULT
+
+def power(x, y):
+    """Integer power, as ^ in charlemagne.lsp
+
+    The lisp version recurses until (eq y 0), so it never returns for
+    anything other than a non-negative integer exponent.
+    """
+    if type(y) not in (int, long) or y < 0:
+        raise NaughtyExpression
+    return float(x) ** y
+
+def negate(x):
+    return -x
+
+ONE_ARGUMENT_FUNCTIONS = {
+    '-':     negate,
+    'ABS':   abs,
+    'SIN':   math.sin,
+    'COS':   math.cos,
+    'TAN':   math.tan,
+    'ATAN':  math.atan,
+    'EXP':   math.exp,
+    'LOG':   math.log,
+    'SQRT':  math.sqrt,
+    }
+
+TWO_ARGUMENT_FUNCTIONS = {
+    '+':     lambda a, b: a + b,
+    '-':     lambda a, b: a - b,
+    '*':     lambda a, b: a * b,
+    '/':     lambda a, b: float(a) / b,
+    '%':     protectedDivide,
+    '^':     power,
+    'MAX':   max,
+    'MIN':   min,
+    }
+
+CONSTANTS = {
+    'PI':                   math.pi,
+    'CONSTANT-SYNTHESIS':   0.0,
+    }
+
+def inputIndex(symbol):
+    """Return the input vector index bound to an INPUTn symbol, or -1"""
+    if symbol[:5] == "INPUT":
+        try:
+            n = int(symbol[5:])
+        except ValueError:
+            return -1
+        if n > 0:
+            return n - 1
+    return -1
+
+def columnChecked(x):
+    """Return x, raising NaughtyExpression if any element is out of single-float range"""
+    if not numpy.all(numpy.abs(x) <= FLOAT_LIMIT):
+        raise NaughtyExpression
+    return x
+
+def columnProtectedDivide(numerator, denominator):
+    """Safe division over columns, as % in charlemagne.lsp"""
+    safe = columnChecked(numpy.abs(denominator) * 10000000000) >= 1
+    return numpy.where(safe, numerator / numpy.where(safe, denominator, 1.0),
+                       SAFE_DEFAULT)
+
+def columnPower(x, y):
+    """Integer power over columns, as ^ in charlemagne.lsp
+
+    Whether an exponent which depends on the inputs is an integer can
+    differ from input to input, so a column of exponents raises
+    UnsupportedExpression and the program is evaluated one input at a time.
+    """
+    if isinstance(y, numpy.ndarray):
+        raise UnsupportedExpression
+    if not isinstance(y, (int, long, numpy.integer)) or y < 0:
+        raise NaughtyExpression
+    return numpy.power(numpy.asarray(x, float), int(y))
+
+def _column(function, scalarfunction):
+    """Make a column function which uses the scalar function on scalar arguments
+
+    Subtrees without inputs are then calculated as in STANDARD evaluation,
+    so an integer stays an integer, as it does in lisp.
+    """
+    def apply(*args):
+        for arg in args:
+            if isinstance(arg, numpy.ndarray):
+                return function(*args)
+        return scalarfunction(*args)
+    return apply
+
+COLUMN_ONE_ARGUMENT_FUNCTIONS = {
+    '-':     _column(numpy.negative, negate),
+    'ABS':   _column(numpy.abs, abs),
+    'SIN':   _column(numpy.sin, math.sin),
+    'COS':   _column(numpy.cos, math.cos),
+    'TAN':   _column(numpy.tan, math.tan),
+    'ATAN':  _column(numpy.arctan, math.atan),
+    'EXP':   _column(numpy.exp, math.exp),
+    'LOG':   _column(numpy.log, math.log),
+    'SQRT':  _column(numpy.sqrt, math.sqrt),
+    }
+
+COLUMN_TWO_ARGUMENT_FUNCTIONS = {
+    '+':     _column(numpy.add, TWO_ARGUMENT_FUNCTIONS['+']),
+    '-':     _column(numpy.subtract, TWO_ARGUMENT_FUNCTIONS['-']),
+    '*':     _column(numpy.multiply, TWO_ARGUMENT_FUNCTIONS['*']),
+    '/':     _column(numpy.true_divide, TWO_ARGUMENT_FUNCTIONS['/']),
+    '%':     _column(columnProtectedDivide, protectedDivide),
+    '^':     _column(columnPower, power),
+    'MAX':   _column(numpy.maximum, max),
+    'MIN':   _column(numpy.minimum, min),
+    }
+
+def compileExpression(expr):
+    """Compile a parsed expression into a function of an input vector
+
+    The returned function evaluates the expression with the semantics of
+    charlemagne.lsp, raising NaughtyExpression where CLISP would have
+    signalled an arithmetic error.  Raises UnsupportedExpression if the
+    expression uses anything which is not available natively.
+    """
+    function = _compile(expr, ONE_ARGUMENT_FUNCTIONS, TWO_ARGUMENT_FUNCTIONS,
+                        checked)
+    def evaluate(vector):
+        try:
+            return function(vector)
+        except (OverflowError, ValueError, ZeroDivisionError):
+            raise NaughtyExpression
+    return evaluate
+
+def compileColumnExpression(expr):
+    """Compile a parsed expression into a function of the input columns
+
+    The returned function takes a sequence of numpy arrays, one per input
+    dimension, and returns an array with the value of the expression for
+    every input.  Non-finite or out of range values stand in for lisp
+    arithmetic errors: if one occurs anywhere, NaughtyExpression is raised
+    just as it would be for a single input.  Raises UnsupportedExpression,
+    when compiling or evaluating, if the expression uses anything which is
+    not available natively.
+    """
+    function = _compile(expr, COLUMN_ONE_ARGUMENT_FUNCTIONS,
+                        COLUMN_TWO_ARGUMENT_FUNCTIONS, columnChecked)
+    def evaluate(columns):
+        errors = numpy.seterr(all='ignore')
+        try:
+            try:
+                y = function(columns)
+            except (OverflowError, ValueError, ZeroDivisionError):
+                raise NaughtyExpression
+        finally:
+            numpy.seterr(**errors)
+        return y + numpy.zeros(len(columns[0]))
+    return evaluate
+
+def _compile(expr, onearg, twoarg, check):
+    if type(expr) <> tuple:
+        return _compileAtom(expr)
+    if len(expr) == 0 or type(expr[0]) <> str:
+        raise UnsupportedExpression
+    args = [_compile(arg, onearg, twoarg, check) for arg in expr[1:]]
+    if len(args) == 1 and onearg.has_key(expr[0]):
+        f = onearg[expr[0]]
+        a = args[0]
+        return lambda v: check(f(a(v)))
+    if len(args) == 2 and twoarg.has_key(expr[0]):
+        f = twoarg[expr[0]]
+        a, b = args
+        return lambda v: check(f(a(v), b(v)))
+    raise UnsupportedExpression
+
+def _compileAtom(expr):
+    if type(expr) <> str:
+        return lambda v: expr
+    if CONSTANTS.has_key(expr):
+        value = CONSTANTS[expr]
+        return lambda v: value
+    i = inputIndex(expr)
+    if i < 0:
+        raise UnsupportedExpression
+    return lambda v: v[i]
+
+def _compareEvaluation(count):
+    """Compare row by row and column evaluation of count random programs
+
+    STANDARD evaluation uses compileExpression and VECTORIZED evaluation
+    compileColumnExpression, so any program on which they disagree is
+    printed.  Returns the number of disagreements.
+    """
+    from programtree import randomTree
+    inputs = numpy.random.uniform(-3, 3, (50, 2))
+    columns = [inputs[:,0].copy(), inputs[:,1].copy()]
+    terminals = ['INPUT1', 'INPUT2', '0', '1', '2', '0.5', 'PI']
+    onearg = ONE_ARGUMENT_FUNCTIONS.keys()
+    twoarg = TWO_ARGUMENT_FUNCTIONS.keys()
+    disagreements = 0
+    numpy.seterr(all='ignore')
+    for i in range(count):
+        lisp = randomTree(6, terminals, onearg, twoarg).toLisp()
+        expr = parse(lisp)
+        try:
+            function = compileExpression(expr)
+            rows = numpy.array([function(list(row)) for row in inputs], float)
+        except NaughtyExpression:
+            rows = None
+        try:
+            column = compileColumnExpression(expr)(columns)
+        except NaughtyExpression:
+            column = None
+        except UnsupportedExpression:
+            continue
+        if rows is None or column is None:
+            agree = rows is None and column is None
+        else:
+            agree = numpy.allclose(rows, column, rtol=1e-9, atol=0)
+        if not agree:
+            disagreements += 1
+            print lisp
+    return disagreements
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) > 1:
+        count = int(sys.argv[1])
+    else:
+        count = 3000
+    disagreements = _compareEvaluation(count)
+    print "%d of %d programs evaluated differently" % (disagreements, count)
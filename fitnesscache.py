@@ -0,0 +1,72 @@
+"""
+Fitness cache module
+
+This module is part of Charlemagne
+Copyright (c) Robert Green 2002, 2003
+
+Charlemagne is distributed under the GNU General Public License.  See
+the file LICENSE.txt in the distribution for details.
+"""
+
+from collections import OrderedDict
+
+class FitnessCache(object):
+    """A bounded cache of Program fitness
+
+    Fitness is cached by a Program's tree together with the identity of the
+    data set it was evaluated on.  When the cache is full the least recently
+    used entry is discarded.
+    """
+
+    __slots__ = ['_size', '_entries', '_hits', '_misses']
+
+    def __init__(self, size):
+        self._size = size
+        self._entries = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key(self, tree, dataset):
+        """Return the cache key for a ProgramTree evaluated on a data set
+
+        ProgramTrees compare equal whatever the white space, case, or the
+        printing of numbers in the lisp they were read from.
+        """
+        return (tree, dataset)
+
+    def get(self, key):
+        """Return the cached (rawfitness, hits) for a key, or None"""
+        try:
+            value = self._entries.pop(key)
+        except KeyError:
+            self._misses += 1
+            return None
+        self._entries[key] = value
+        self._hits += 1
+        return value
+
+    def put(self, key, rawfitness, hits):
+        """Cache the rawfitness and hits for a key"""
+        if self._entries.has_key(key):
+            del self._entries[key]
+        elif len(self._entries) >= self._size:
+            self._entries.popitem(last=False)
+        self._entries[key] = (rawfitness, hits)
+
+    def clear(self):
+        """Discard all cached entries"""
+        self._entries.clear()
+
+    def getHits(self):
+        """Returns the number of lookups which were found in the cache"""
+        return self._hits
+
+    def getMisses(self):
+        """Returns the number of lookups which were not found in the cache"""
+        return self._misses
+
+    def help(self):
+        help(type(self))
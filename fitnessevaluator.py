@@ -8,7 +8,24 @@ Charlemagne is distributed under the GNU General Public License.  See
 the file LICENSE.txt in the distribution for details.
 """
 
+import itertools
+import numpy
+
 from exception import NaughtyExpression
+from exception import UnsupportedExpression
+from expression import parse
+from expression import compileColumnExpression
+from subtreecache import SubtreeCache
+from deviancecalculator import LispFunctionDevianceCalculator
+
+# the raw fitness given to Programs which cause an arithmetic error
+PUNISHMENT = 999999
+
+# how close a Program answer must be to be considered a hit
+PRECISION = 0.01
+
+# identities for the data sets programs are evaluated on, for caching
+_datasets = itertools.count()
 
 class FitnessEvaluator(object):
     """A class which calculates the fitness of a Program in a particular Environment.
@@ -17,19 +34,51 @@ class FitnessEvaluator(object):
     instance.
     """
 
-    __slots__ = ['_interpreter', '_deviancecalculator', '_input', '_output']
+    __slots__ = ['_interpreter', '_deviancecalculator', '_input', '_output',
+                 '_cache', '_dataset', '_bound']
 
     def __init__(self, input, output, interpreter, deviancecalculator):
         self._input = input
         self._output = output
         self._interpreter = interpreter
         self._deviancecalculator = deviancecalculator
+        self._cache = None
+        self._bound = None
+        self._dataset = _datasets.next()
 
     def setInput(self, input):
         self._input = input
+        self._dataset = _datasets.next()
         
     def setOutput(self, output):
         self._output = output
+        self._dataset = _datasets.next()
+
+    def setCache(self, cache):
+        """Set the FitnessCache to use, or None to disable caching
+
+        Programs whose fitness on the current data set is already cached
+        are not evaluated again.
+        """
+        self._cache = cache
+
+    def getCache(self):
+        """Return the FitnessCache in use, or None"""
+        return self._cache
+
+    def setBound(self, bound):
+        """Set the raw fitness beyond which evaluation may stop early, or None
+
+        A Program whose raw fitness passes the bound part way through the
+        inputs keeps the raw fitness and hits so far, and is marked as
+        bounded.  Subclasses which evaluate every input at once ignore the
+        bound.
+        """
+        self._bound = bound
+
+    def getBound(self):
+        """Return the raw fitness beyond which evaluation may stop early, or None"""
+        return self._bound
 
     def evaluate(self, p):
         """Evaluate and update specified program with its basic fitness information
@@ -37,19 +86,81 @@ class FitnessEvaluator(object):
         The deviance of the Program is calculated using the DevianceCalculator instance.
         The basic fitness properties of the Program are set (rawfitness and hits).
         """
+        if self._cache is None:
+            self._evaluate(p)
+            return
+        key = self._cache.key(p.tree, self._dataset)
+        cached = self._cache.get(key)
+        if cached is None:
+            self._evaluate(p)
+            if not p.isBounded():
+                self._cache.put(key, p.rawfitness, p.hits)
+        else:
+            p.setRawFitness(cached[0])
+            p.setHits(cached[1])
+
+    def evaluateAll(self, programs):
+        """Evaluate and update a list of programs with their basic fitness information
+
+        Programs which are cached, or are duplicates of another program in
+        the list, are only evaluated once.
+        """
+        if self._cache is None:
+            self._evaluateAll(programs)
+            return
+        pending = [] ; keys = {} ; duplicates = []
+        for p in programs:
+            key = self._cache.key(p.tree, self._dataset)
+            if keys.has_key(key):
+                duplicates.append((p, keys[key]))
+                continue
+            cached = self._cache.get(key)
+            if cached is None:
+                pending.append(p)
+                keys[key] = p
+            else:
+                p.setRawFitness(cached[0])
+                p.setHits(cached[1])
+        self._evaluateAll(pending)
+        for key in keys.keys():
+            p = keys[key]
+            if not p.isBounded():
+                self._cache.put(key, p.rawfitness, p.hits)
+        for p, original in duplicates:
+            p.setRawFitness(original.rawfitness)
+            p.setHits(original.hits)
+            p.setBounded(original.isBounded())
+
+    def _evaluate(self, p):
+        """Evaluate a program, without regard to the cache
+
+        Override this in subclasses to change how fitness is calculated.
+        """
         try:
             rawfitness = 0 ; hits = 0
-            precision = 0.01
+            precision = PRECISION ; bound = self._bound
             inputct = len(self._input)
             for i in range(inputct):
                 d = self._deviancecalculator.calculate(p, i)
                 rawfitness = rawfitness + d
                 hits = hits + (d <= precision)
+                if bound is not None and rawfitness > bound:
+                    p.setBounded(1)
+                    break
             p.setRawFitness(rawfitness)
             p.setHits(hits)
         except NaughtyExpression:
             self.punish(p)
 
+    def _evaluateAll(self, programs):
+        """Evaluate a list of programs, without regard to the cache
+
+        Override this in subclasses which can evaluate many programs at
+        once more efficiently than one at a time.
+        """
+        for p in programs:
+            self._evaluate(p)
+
     def punish(self, p):
         """Severely punish this program
 
@@ -58,7 +169,7 @@ class FitnessEvaluator(object):
         """
         # FIXME: this is arbitrary and therefore very bad
         # in some contexts, this rawfitness could be excellent!
-        p.setRawFitness(999999)
+        p.setRawFitness(PUNISHMENT)
         p.setHits(0)
 
     def best(self, p1, p2):
@@ -95,6 +206,262 @@ class FitnessEvaluator(object):
     #                       hits = hits + 1
     #       return hits
 
+class VectorizedFitnessEvaluator(FitnessEvaluator):
+    """A FitnessEvaluator which evaluates a Program over all of the inputs at once
+
+    The lisp expression of the Program is compiled into numpy operations on
+    the columns of the input matrix, and deviance and hits for every input
+    come from array operations.  This is only suitable for output deviance
+    calculation.  Programs which use functions that are not available
+    natively are evaluated one input at a time by the DevianceCalculator.
+    """
+
+    __slots__ = ['_columns', '_outputarray']
+
+    def __init__(self, input, output, interpreter, deviancecalculator):
+        FitnessEvaluator.__init__(self, input, output, interpreter,
+                                  deviancecalculator)
+        self.setInput(input)
+        self.setOutput(output)
+
+    def setInput(self, input):
+        FitnessEvaluator.setInput(self, input)
+        matrix = numpy.asarray(input, float)
+        self._columns = [matrix[:,i] for i in range(matrix.shape[1])]
+
+    def setOutput(self, output):
+        FitnessEvaluator.setOutput(self, output)
+        self._outputarray = numpy.asarray(output, float)
+
+    def _evaluate(self, p):
+        """Evaluate a program over all of the inputs at once
+
+        If any input causes an arithmetic error the Program is punished, as
+        it would be by FitnessEvaluator.
+        """
+        try:
+            y = compileColumnExpression(parse(p.lisp))(self._columns)
+        except UnsupportedExpression:
+            FitnessEvaluator._evaluate(self, p)
+            return
+        except NaughtyExpression:
+            self.punish(p)
+            return
+        self._setFitness(p, y)
+
+    def _setFitness(self, p, y):
+        """Set the fitness of a program from its values for every input"""
+        deviance = numpy.abs(self._outputarray - y)
+        p.setRawFitness(float(deviance.sum()))
+        p.setHits(int(numpy.sum(deviance <= PRECISION)))
+
+class SharedSubtreeFitnessEvaluator(VectorizedFitnessEvaluator):
+    """A VectorizedFitnessEvaluator which evaluates each distinct subtree once
+
+    Crossover and replication leave the programs of a generation sharing
+    many subtrees.  A SubtreeCache identifies the subtrees common to the
+    generation and evaluates each over the inputs only once.  Programs are
+    assembled from the cached results of their subtrees.
+    """
+
+    __slots__ = ['_subtrees']
+
+    # default memory budget for subtree results, in bytes
+    BUDGET = 64 * 1024 * 1024
+
+    def __init__(self, input, output, interpreter, deviancecalculator):
+        self._subtrees = SubtreeCache(self.BUDGET)
+        VectorizedFitnessEvaluator.__init__(self, input, output, interpreter,
+                                            deviancecalculator)
+
+    def setSubtreeCache(self, subtrees):
+        """Set the SubtreeCache to use"""
+        self._subtrees = subtrees
+
+    def getSubtreeCache(self):
+        """Return the SubtreeCache in use"""
+        return self._subtrees
+
+    def setInput(self, input):
+        VectorizedFitnessEvaluator.setInput(self, input)
+        self._subtrees.clear()
+
+    def _evaluate(self, p):
+        """Evaluate a program over all of the inputs at once, sharing subtree results"""
+        try:
+            y = self._subtrees.evaluate(p.tree, self._columns)
+        except UnsupportedExpression:
+            FitnessEvaluator._evaluate(self, p)
+            return
+        except NaughtyExpression:
+            self.punish(p)
+            return
+        self._setFitness(p, y)
+
+    def _evaluateAll(self, programs):
+        """Evaluate a generation of programs
+
+        The subtrees of each generation are identified afresh.
+        """
+        self._subtrees.clear()
+        VectorizedFitnessEvaluator._evaluateAll(self, programs)
+
+class ChunkedFitnessEvaluator(FitnessEvaluator):
+    """A FitnessEvaluator which streams the input set through in blocks of rows
+
+    As with the VectorizedFitnessEvaluator, Programs are evaluated natively
+    over many inputs at once, but only over one block of rows at a time, so
+    memory use is bounded by the block size however big the input set is.
+    Each block is evaluated for the whole list of Programs before moving on
+    to the next, so a memory mapped input set is read once per generation.
+    The raw fitness and hits are accumulated across the blocks.
+    """
+
+    __slots__ = ['_matrix', '_outputarray', '_blocksize']
+
+    # default number of rows in a block
+    BLOCKSIZE = 65536
+
+    def __init__(self, input, output, interpreter, deviancecalculator):
+        self._blocksize = self.BLOCKSIZE
+        FitnessEvaluator.__init__(self, input, output, interpreter,
+                                  deviancecalculator)
+        self.setInput(input)
+        self.setOutput(output)
+
+    def setInput(self, input):
+        FitnessEvaluator.setInput(self, input)
+        # a float64 matrix, including a memory mapped one, is not copied
+        self._matrix = numpy.asarray(input, float)
+
+    def setOutput(self, output):
+        FitnessEvaluator.setOutput(self, output)
+        self._outputarray = numpy.asarray(output, float)
+
+    def setBlockSize(self, blocksize):
+        """Set the number of rows evaluated at a time"""
+        self._blocksize = blocksize
+
+    def getBlockSize(self):
+        """Return the number of rows evaluated at a time"""
+        return self._blocksize
+
+    def _evaluate(self, p):
+        self._evaluateAll([p])
+
+    def _evaluateAll(self, programs):
+        """Evaluate a list of programs one block of inputs at a time
+
+        Programs which can't be evaluated natively are evaluated one input
+        at a time by the DevianceCalculator.  A Program which causes an
+        arithmetic error in any block is punished.  A Program whose raw
+        fitness passes the bound is not evaluated on any more blocks.
+        """
+        running = []
+        for p in programs:
+            try:
+                function = compileColumnExpression(parse(p.lisp))
+            except UnsupportedExpression:
+                FitnessEvaluator._evaluate(self, p)
+                continue
+            running.append([p, function, 0.0, 0])
+        matrix = self._matrix ; blocksize = self._blocksize
+        for start in range(0, len(matrix), blocksize):
+            if len(running) == 0:
+                break
+            end = min(start + blocksize, len(matrix))
+            columns = [numpy.array(matrix[start:end,i])
+                       for i in range(matrix.shape[1])]
+            output = self._outputarray[start:end]
+            survivors = []
+            for entry in running:
+                try:
+                    y = entry[1](columns)
+                except UnsupportedExpression:
+                    FitnessEvaluator._evaluate(self, entry[0])
+                    continue
+                except NaughtyExpression:
+                    self.punish(entry[0])
+                    continue
+                deviance = numpy.abs(output - y)
+                entry[2] = entry[2] + float(deviance.sum())
+                entry[3] = entry[3] + int(numpy.sum(deviance <= PRECISION))
+                if self._bound is not None and entry[2] > self._bound:
+                    entry[0].setBounded(1)
+                    entry[0].setRawFitness(entry[2])
+                    entry[0].setHits(entry[3])
+                    continue
+                survivors.append(entry)
+            running = survivors
+        for p, function, rawfitness, hits in running:
+            p.setRawFitness(rawfitness)
+            p.setHits(hits)
+
+class BatchFitnessEvaluator(FitnessEvaluator):
+    """A FitnessEvaluator which evaluates a whole list of Programs in one interpreter query
+
+    The lisp expressions of all the Programs and the input set are sent to
+    the interpreter together, and the rawfitness, hits and depth of every
+    Program come back in a single reply.  This is suitable for output and
+    lisp function deviance calculation.
+    """
+
+    __slots__ = []
+
+    def _evaluate(self, p):
+        """Evaluate a program in a batch of its own
+
+        ...
+        """
+        self._evaluateAll([p])
+
+    def _evaluateAll(self, programs):
+        """Evaluate a list of programs in one interpreter query
+
+        Programs which cause an arithmetic error are punished.
+        """
+        if len(programs) == 0:
+            return
+        if isinstance(self._deviancecalculator, LispFunctionDevianceCalculator):
+            function = self._deviancecalculator.getExpression()
+        else:
+            function = None
+        results = self._interpreter.evaluateBatch([p.lisp for p in programs],
+                                                  self._input, self._output,
+                                                  function, PRECISION)
+        for i in range(len(programs)):
+            p = programs[i]
+            rawfitness, hits, depth = results[i]
+            if rawfitness is None:
+                self.punish(p)
+            else:
+                p.setRawFitness(rawfitness)
+                p.setHits(hits)
+            p.setDepth(depth)
+
+class CompiledFitnessEvaluator(FitnessEvaluator):
+    """A FitnessEvaluator which has each Program evaluated over the whole input set at once
+
+    The DevianceCalculator calculates the rawfitness and hits of a Program
+    in one go.  With output and lisp function deviance calculation the
+    interpreter keeps the inputs and outputs resident, compiles the Program
+    once, and loops over the inputs itself.
+    """
+
+    __slots__ = []
+
+    def _evaluate(self, p):
+        """Evaluate a program over all of the inputs at once
+
+        ...
+        """
+        try:
+            rawfitness, hits = self._deviancecalculator.calculateFitness(p, PRECISION)
+            p.setRawFitness(rawfitness)
+            p.setHits(hits)
+        except NaughtyExpression:
+            self.punish(p)
+
 #class OutputListFitnessEvaluator(FitnessEvaluator):
 #
 #    """A FitnessCalculator which is a straight forward measurement of the
@@ -11,7 +11,14 @@ the file LICENSE.txt in the distribution for details.
 import pylisp
 import os
 import sys
+import string
+import threading
+import Queue
 from exception import NaughtyExpression
+from exception import UnsupportedExpression
+from expression import parse
+from expression import compileExpression
+from expression import depth
 from pylisp.client import PyLisp
 
 class Interpreter(object):
@@ -60,6 +67,7 @@ class CLISPInterpreter(PyLisp, LispInterpreter):
                         lisp_path+"/pylisp_server.lsp"
                         )
                        )
+        self._fitnesscases = None
                                                       
     def eval(self, p):
         """Evaluate the lisp expression
@@ -100,7 +108,7 @@ class CLISPInterpreter(PyLisp, LispInterpreter):
 
         ...
         """
-        if vector <> None:
+        if vector is not None:
             self.setInputVector(vector)
         return self.querySolution(expr)
 
@@ -111,3 +119,248 @@ class CLISPInterpreter(PyLisp, LispInterpreter):
         """
         q = "(depth '%s)" % (expr)
         return int(self.querySolution(q))
+
+    def setFitnessCases(self, inputs, outputs=None):
+        """Make the fitness cases resident in the interpreter
+
+        The input list and output list are sent once, and are used by
+        fitnessOf and evaluateBatch until different lists are set.  The
+        output list may be None when a deviance function is used.  Lists
+        are recognized by identity, so set them again after modifying them
+        in place.
+        """
+        if self._fitnesscases is not None and \
+           self._fitnesscases[0] is inputs and self._fitnesscases[1] is outputs:
+            return
+        lstr = str ; join = string.join
+        rows = []
+        for vector in inputs:
+            rows.append("(" + join(map(lstr, vector), " ") + ")")
+        if outputs is None:
+            outputlist = "NIL"
+        else:
+            outputlist = "'(" + join(map(lstr, outputs), " ") + ")"
+        q = "(set-fitness-cases '(%s) %s)" % (join(rows, " "), outputlist)
+        self.querySolution(q)
+        self._fitnesscases = (inputs, outputs)
+
+    def fitnessOf(self, expr, inputs, outputs=None, deviancefunction=None,
+                  precision=0.01):
+        """Calculate the raw fitness and hits of an expression over the fitness cases
+
+        The expression is compiled once by the interpreter and run for every
+        fitness case without further round trips.  The deviance on each
+        input is the distance from the corresponding output, or if the name
+        of a deviance function is given, the absolute value of the function
+        applied to the expression.
+
+        This can raise NaughtyExpression which should be dealt with in the
+        caller.
+        """
+        self.setFitnessCases(inputs, outputs)
+        if deviancefunction is None:
+            q = "(fitness-of '%s %s)" % (expr, precision)
+        else:
+            q = "(fitness-of '%s %s '%s)" % (expr, precision, deviancefunction)
+        rawfitness, hits = parse(self.querySolution(q))
+        return (rawfitness, hits)
+
+    def evaluateBatch(self, exprs, inputs, outputs=None, deviancefunction=None,
+                      precision=0.01):
+        """Calculate the fitness of a list of expressions in one query
+
+        The fitness cases are made resident first (see setFitnessCases), and
+        deviance is calculated as by fitnessOf.  Returns a list of
+        (rawfitness, hits, depth) tuples, with a rawfitness of None for
+        expressions which caused an arithmetic error.
+        """
+        self.setFitnessCases(inputs, outputs)
+        if deviancefunction is None:
+            function = "NIL"
+        else:
+            function = "'" + deviancefunction
+        q = "(batch-fitness '(%s) %s %s)" % \
+            (string.join(exprs, " "), precision, function)
+        results = []
+        for rawfitness, hits, d in parse(self.querySolution(q)):
+            if rawfitness == "NAUGHTY":
+                rawfitness = None
+            results.append((rawfitness, hits, d))
+        return results
+
+
+class PythonInterpreter(CLISPInterpreter):
+    """A CLISPInterpreter which evaluates program expressions natively in Python
+
+    Expressions built from the vocabulary understood by the expression
+    module are parsed and compiled once, then evaluated without a round trip
+    to CLISP.  Anything else, such as the structural queries made by Program
+    or user defined lisp functions, is passed through to CLISP.
+    """
+
+    def __init__(self, cachesize=10000):
+        CLISPInterpreter.__init__(self)
+        self._cachesize = cachesize
+        self._compiled = {}
+        self._vector = None
+        self._vectorqueued = 0
+
+    def _compile(self, expr):
+        """Return the compiled function for expr, or None if it is unsupported
+
+        Compiled functions are cached by expression text.
+        """
+        try:
+            return self._compiled[expr]
+        except KeyError:
+            pass
+        try:
+            function = compileExpression(parse(expr))
+        except UnsupportedExpression:
+            function = None
+        if len(self._compiled) >= self._cachesize:
+            self._compiled.clear()
+        self._compiled[expr] = function
+        return function
+
+    def setInputVector(self, vector):
+        """Set the input vector to evaluate on
+
+        The vector is only sent to CLISP when an expression has to be
+        passed through.
+        """
+        self._vector = vector
+        self._vectorqueued = 1
+
+    def evaluate(self, expr, vector=None):
+        """Evaluate a CLISP compatible expression
+
+        This can raise NaughtyExpression which should be dealt with in the
+        caller.
+        """
+        if vector is not None:
+            self.setInputVector(vector)
+        function = None
+        if self._vector is not None:
+            function = self._compile(expr)
+        if function is None:
+            if self._vectorqueued:
+                CLISPInterpreter.setInputVector(self, self._vector)
+                self._vectorqueued = 0
+            return self.querySolution(expr)
+        return function(self._vector)
+
+    def evaluateBatch(self, exprs, inputs, outputs=None, deviancefunction=None,
+                      precision=0.01):
+        """Calculate the fitness of a list of expressions
+
+        Expressions which can be evaluated natively are, and any others are
+        passed through to CLISP together in one query.
+        """
+        results = [None] * len(exprs)
+        passthrough = []
+        for i in range(len(exprs)):
+            function = None
+            if deviancefunction is None:
+                function = self._compile(exprs[i])
+            if function is None:
+                passthrough.append(i)
+                continue
+            try:
+                rawfitness, hits = self._fitness(function, inputs, outputs,
+                                                 precision)
+            except NaughtyExpression:
+                rawfitness, hits = None, 0
+            results[i] = (rawfitness, hits, depth(parse(exprs[i])))
+        if len(passthrough) > 0:
+            lispresults = CLISPInterpreter.evaluateBatch(self,
+                              [exprs[i] for i in passthrough],
+                              inputs, outputs, deviancefunction, precision)
+            for i in range(len(passthrough)):
+                results[passthrough[i]] = lispresults[i]
+        return results
+
+    def fitnessOf(self, expr, inputs, outputs=None, deviancefunction=None,
+                  precision=0.01):
+        """Calculate the raw fitness and hits of an expression over the fitness cases
+
+        The expression is evaluated natively if possible, otherwise it is
+        passed through to CLISP.
+        """
+        function = None
+        if deviancefunction is None:
+            function = self._compile(expr)
+        if function is None:
+            return CLISPInterpreter.fitnessOf(self, expr, inputs, outputs,
+                                              deviancefunction, precision)
+        return self._fitness(function, inputs, outputs, precision)
+
+    def _fitness(self, function, inputs, outputs, precision):
+        rawfitness = 0 ; hits = 0
+        for i in range(len(inputs)):
+            d = abs(outputs[i] - function(inputs[i]))
+            rawfitness = rawfitness + d
+            hits = hits + (d <= precision)
+        return (rawfitness, hits)
+
+class InterpreterPool(object):
+    """A pool of interpreters which evaluates batches of expressions in parallel
+
+    Every interpreter in the pool runs in its own lisp process.  A batch is
+    split into chunks which are fed to the interpreters from a queue, one
+    thread per interpreter, so the pool keeps as many processors busy as
+    it has interpreters.
+    """
+
+    def __init__(self, size, interpreterclass=CLISPInterpreter):
+        self._interpreters = []
+        for i in range(size):
+            self._interpreters.append(interpreterclass())
+
+    def __len__(self):
+        return len(self._interpreters)
+
+    def broadcast(self, expr):
+        """Evaluate an expression on every interpreter in the pool
+
+        Use this to load lisp environment files, define functions, etc.
+        """
+        for interpreter in self._interpreters:
+            interpreter.evaluate(expr)
+
+    def evaluateBatch(self, exprs, inputs, outputs=None, deviancefunction=None,
+                      precision=0.01):
+        """Calculate the fitness of a list of expressions across the pool
+
+        Takes the same arguments and returns the same results as
+        CLISPInterpreter.evaluateBatch.
+        """
+        chunksize = max(1, len(exprs) / (len(self._interpreters) * 4))
+        chunks = Queue.Queue()
+        for start in range(0, len(exprs), chunksize):
+            chunks.put(start)
+        results = [None] * len(exprs)
+        errors = []
+        def work(interpreter):
+            try:
+                while 1:
+                    try:
+                        start = chunks.get_nowait()
+                    except Queue.Empty:
+                        break
+                    end = start + chunksize
+                    results[start:end] = interpreter.evaluateBatch(
+                        exprs[start:end], inputs, outputs, deviancefunction,
+                        precision)
+            except:
+                errors.append(sys.exc_info())
+        threads = []
+        for interpreter in self._interpreters:
+            thread = threading.Thread(target=work, args=(interpreter,))
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        if len(errors) > 0:
+            raise errors[0][0], errors[0][1], errors[0][2]
+        return results
@@ -0,0 +1,253 @@
+"""
+Island module
+
+This module is part of Charlemagne
+Copyright (c) Robert Green 2002, 2003
+
+Charlemagne is distributed under the GNU General Public License.  See
+the file LICENSE.txt in the distribution for details.
+"""
+
+import random
+import traceback
+import Queue
+import multiprocessing
+import numpy
+
+from exception import IslandException
+from exception import UnimplementedVirtualMethod
+from population import Population
+
+# seconds to wait for a result before checking the island processes are alive
+POLL_INTERVAL = 1.0
+
+# seconds to wait for islands to stop once breeding has failed
+STOP_TIMEOUT = 10.0
+
+class Migrator(object):
+    """An interface class for sending programs from an island to other islands
+
+    Migrators and Immigrators operate in pairs: programs sent by a kind of
+    Migrator are received by the matching kind of Immigrator.
+    """
+
+    __slots__ = []
+
+    def emigrate(self, programs):
+        """Send copies of a list of programs to another island"""
+        raise UnimplementedVirtualMethod
+
+    def close(self):
+        """Called when the island has finished breeding"""
+        pass
+
+    def help(self):
+        help(type(self))
+
+class Immigrator(object):
+    """An interface class for receiving programs sent from other islands"""
+
+    __slots__ = []
+
+    def immigrate(self):
+        """Return the lisp expressions of the programs which have arrived
+
+        This must not wait for programs to arrive.
+        """
+        raise UnimplementedVirtualMethod
+
+    def help(self):
+        help(type(self))
+
+class QueueMigrator(Migrator):
+    """A Migrator which puts programs on the queue of another island process
+
+    With the RING topology island i always sends to island i+1, and the
+    last island to the first.  With the RANDOM topology each migration goes
+    to a randomly chosen other island.
+    """
+
+    __slots__ = ['_index', '_queues', '_topology']
+
+    def __init__(self, index, queues, topology="RING"):
+        self._index = index
+        self._queues = queues
+        self._topology = topology
+
+    def emigrate(self, programs):
+        n = len(self._queues)
+        if n < 2:
+            return
+        if self._topology == "RANDOM":
+            destination = random.randint(0, n - 2)
+            if destination >= self._index:
+                destination += 1
+        else:
+            destination = (self._index + 1) % n
+        self._queues[destination].put([p.lisp for p in programs])
+
+    def close(self):
+        # programs sent to islands which have already finished are never
+        # read, so don't wait for them to be flushed before exiting
+        for queue in self._queues:
+            queue.cancel_join_thread()
+
+class QueueImmigrator(Immigrator):
+    """An Immigrator which takes programs from an island process's own queue"""
+
+    __slots__ = ['_queue']
+
+    def __init__(self, queue):
+        self._queue = queue
+
+    def immigrate(self):
+        immigrants = []
+        while 1:
+            try:
+                immigrants.extend(self._queue.get_nowait())
+            except Queue.Empty:
+                break
+        return immigrants
+
+class Archipelago(object):
+    """Breeds a configured Environment's population on several islands at once
+
+    Each island is a Population with its own interpreter, bred in its own
+    process.  Every migration interval generations each island sends copies
+    of its fittest programs to another island, where they replace the least
+    fit programs.  Breeding stops when any island finds a solution.
+    """
+
+    __slots__ = ['_environment', '_interpreterclass', '_populationclass']
+
+    def __init__(self, env, interpreterclass, populationclass=Population):
+        self._environment = env
+        self._interpreterclass = interpreterclass
+        self._populationclass = populationclass
+
+    def getEnvironment(self):
+        """Returns the Environment the islands are bred in"""
+        return self._environment
+
+    def _makeInterpreter(self):
+        """Factory method for instantiating an island's interpreter
+
+        The interpreter is loaded with the lisp environment file if there
+        is one.
+        """
+        interpreter = self._interpreterclass()
+        if self._environment.getLispEnvironmentFile() <> None:
+            interpreter.evaluate('(load "' +
+                                 self._environment.getLispEnvironmentFile() + '")')
+        return interpreter
+
+    def _makePopulation(self, interpreter):
+        """Factory method for instantiating an island's Population"""
+        return self._populationclass(self._environment, interpreter)
+
+    def _makeMigration(self, n):
+        """Factory method for instantiating the Migrator and Immigrator of each island
+
+        Returns a list of (Migrator, Immigrator) pairs, one for each of n
+        islands.
+        """
+        queues = [multiprocessing.Queue() for i in range(n)]
+        topology = self._environment.getMigrationTopology()
+        return [(QueueMigrator(i, queues, topology), QueueImmigrator(queues[i]))
+                for i in range(n)]
+
+    def breed(self, generations=None):
+        """Breed the islands until a solution is found
+
+        If generations is given, stop after that many generations even if
+        no solution has been found.  Returns a list with the best program
+        of each island as (island, generation, hits, adjusted fitness, lisp),
+        fittest first.  Raises IslandException if an island fails or dies
+        without reporting its best program; the other islands are stopped.
+        """
+        n = self._environment.getIslands()
+        results = multiprocessing.Queue()
+        stop = multiprocessing.Event()
+        processes = []
+        migration = self._makeMigration(n)
+        for i in range(n):
+            migrator, immigrator = migration[i]
+            process = multiprocessing.Process(target=_breedIsland,
+                                              args=(self, i, migrator, immigrator,
+                                                    generations, stop, results))
+            process.start()
+            processes.append(process)
+        best = []
+        lost = []
+        try:
+            while len(best) < n:
+                try:
+                    index, error, result = results.get(timeout=POLL_INTERVAL)
+                except Queue.Empty:
+                    # an island which was already dead at the last poll has
+                    # had time to flush its result, so it never sent one
+                    reported = [b[0] for b in best]
+                    dead = [i for i in range(n) if i not in reported and
+                            not processes[i].is_alive()]
+                    for i in dead:
+                        if i in lost:
+                            raise IslandException("island %d died with exit code %s"
+                                                  % (i, processes[i].exitcode))
+                    lost = dead
+                    continue
+                if error <> None:
+                    raise IslandException("island %d failed:\n%s" % (index, error))
+                best.append(result)
+        except:
+            stop.set()
+            for process in processes:
+                process.join(STOP_TIMEOUT)
+                if process.is_alive():
+                    process.terminate()
+            raise
+        for process in processes:
+            process.join()
+        best.sort(lambda a, b: cmp(b[3], a[3]))
+        return best
+
+    def help(self):
+        help(type(self))
+
+def _breedIsland(archipelago, index, migrator, immigrator, generations, stop, results):
+    """Breed one island, the body of an island process
+
+    Always puts (index, error, result) on the results queue: result is the
+    island's best program, or error the traceback of whatever stopped the
+    island from breeding, in which case every island is told to stop.
+    """
+    error = None ; result = None
+    try:
+        try:
+            # the process is forked, so reseed or every island breeds alike
+            random.seed()
+            numpy.random.seed()
+            env = archipelago.getEnvironment()
+            interpreter = archipelago._makeInterpreter()
+            env.initialize(interpreter)
+            population = archipelago._makePopulation(interpreter)
+            population.populate()
+            interval = env.getMigrationInterval()
+            while not (stop.is_set() or population.isSuccessful() or
+                       population.getGeneration() == generations):
+                population.next()
+                if population.getGeneration() % interval == 0:
+                    migrator.emigrate(population.getFittest(env.getMigrants()))
+                    immigrants = immigrator.immigrate()
+                    if len(immigrants) > 0:
+                        population.immigrate(immigrants)
+            if population.isSuccessful():
+                stop.set()
+            best = population.getBestProgram()
+            result = (index, population.getGeneration(), best.getHits(),
+                      best.adjustedFitness(), best.lisp)
+        except:
+            error = traceback.format_exc()
+            stop.set()
+    finally:
+        migrator.close()
+        results.put((index, error, result))
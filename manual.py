@@ -41,6 +41,7 @@ Requirements
 * Linux / Unix?
 * Python 2.x (http://python.org)
 * CLISP (http://clisp.cons.org)
+* NumPy (http://numpy.org)
 
 Currently, support is limited to Unix-like operating systems, and only 
 Linux has been tested.  There is one technical issue preventing Windows 
@@ -508,10 +509,32 @@ OUTPUT method.  Example outputs file::
     0
     -2
     
-Use this instead of specifying the outputs directly with the Output 
+Use this instead of specifying the outputs directly with the Output
 parameter.
 
 
+Dataset Cache (--dataset-cache)
+-------------------------------
+Read the inputs and outputs files by way of a binary cache.  The first run
+to read a file saves its numbers beside it, in a file named after it with
+its size and modification time and ending in .npy.  Later runs memory map
+the cache instead of parsing the file again, so they start almost at once,
+and runs on the same machine share one copy of the data in memory.  When
+the file changes, a new cache is made and the old one is removed.  If the
+cache can't be written, the file is just read as usual.
+
+
+Input Subset (--input-subset)
+-----------------------------
+Evaluate fitness based on a random subset of the inputs of the specified
+size, which must be at least 1.  A new subset is drawn every generation, and every program is
+evaluated on it, including those carried over from the last generation, so
+fitnesses are always compared on the same inputs.  This cuts the cost of
+each generation by the ratio of the subset size to the number of inputs.
+A program which scores a hit on every input of the subset is evaluated on
+all of the inputs before it is accepted as a solution.
+
+
 Generate Outputs (--generate-outputs)
 -------------------------------------
 Generate output values from the input values using the specified method.  
@@ -592,6 +615,8 @@ Available methods are:
 
 * FITNESS-PROPORTIONATE=<degree>
 * TOURNAMENT=<size>.  
+* ROULETTE-WHEEL
+* STOCHASTIC-UNIVERSAL
 
 FITNESS-PROPORTIONATE selection prefers fit to unfit programs and degree is 
 a measure of how tightly bound this selection is.  A degree of 1.0 is very 
@@ -602,6 +627,15 @@ TOURNAMENT selection randomly selects programs from the population
 and holds a tournament of the specified size.  The best program in the 
 tournament is selected.
 
+ROULETTE-WHEEL selection selects programs with probability proportional 
+to their adjusted fitness.  The wheel is built once per generation, so 
+each selection takes constant time.
+
+STOCHASTIC-UNIVERSAL selection is also proportional to adjusted fitness, 
+but draws the parents for a whole generation in one pass of evenly 
+spaced pointers around the wheel.  This has lower variance than spinning 
+the wheel once for each parent.
+
 
 Precision (--precision)
 -----------------------
@@ -612,7 +646,55 @@ Force Best (--force-best)
 -------------------------
 Force the best program to replicate into the new generation the specified 
 number of times.
-  
+
+
+Simplify (--simplify)
+---------------------
+Simplify each program produced by crossover, mutation or randomization.
+Function calls on constants, such as (* 0.37 (+ 1.2 -0.4)), are replaced
+by their value, and (+ x 0), (- x 0), (* x 1), (% x 1) and (- (- x)) are
+replaced by x.  Protected division by a constant becomes multiplication by
+its reciprocal.  Nothing which could cause an arithmetic error is removed,
+and the protected operators keep their meaning.  Simplification happens
+before the depth of a program is checked, so simplified programs can grow
+more before reaching the maximum depth.  Only the natively known functions
+are folded, so functions defined in a fitness environment are left alone.
+
+
+Fitness Cache (--fitness-cache)
+-------------------------------
+Cache the fitness of the specified number of programs.  Replication, the 
+force best feature, and crossovers which return a parent unchanged all 
+produce programs which have been evaluated before.  With a fitness cache, 
+these are looked up rather than evaluated again.  When the cache is full, 
+the least recently used fitness is discarded.  Do not use a fitness cache 
+if the fitness of a program can differ from one evaluation to the next, 
+for example with a deviance calculator based on a random simulation.
+
+
+Racing (--racing)
+-----------------
+Stop evaluating a program as soon as it is known to be worse than a 
+threshold, so that little work is spent on hopeless offspring.  The raw 
+fitness and hits of the inputs evaluated so far are kept as a lower bound 
+on the program's true raw fitness; bounded fitnesses are not put in the 
+fitness cache.
+
+With steady-state breeding, each offspring races the loser of its 
+replacement tournament.  As soon as it is worse than the loser it is 
+dropped, rather than replacing a better program.  With generational breeding 
+every offspring enters the next generation, so the threshold is the raw 
+fitness below which 90% of the fully evaluated programs of the last 
+generation fall, leaving out punished programs.  Programs worse than that 
+are bounded: their adjusted fitness is 0, so they rank below every fully 
+evaluated program in selection.
+
+Only the STANDARD and CHUNKED fitness evaluation methods race, the CHUNKED 
+method a block at a time.  A solution is always evaluated on every input.  
+With an input subset, the raw fitness of the last generation says nothing 
+about the next subset, so with generational breeding programs don't race 
+at all.
+
 
 Fitness Environment File (--fitness-environment)
 ------------------------------------------------
@@ -657,4 +739,155 @@ well a particular program played the game.  When defining deviance
 calculators, a deviance of zero is the perfect program with the higher the 
 deviance is, the worse that program is.
 
+
+Interpreter (--interpreter)
+---------------------------
+Evaluate programs using the specified interpreter.
+
+Available interpreters are:
+
+* CLISP
+* PYTHON
+
+The CLISP interpreter (the default) evaluates every program on every input 
+by sending it to the lisp interpreter.  The PYTHON interpreter parses each 
+program once and evaluates it natively in Python, which avoids a round trip 
+to lisp for each fitness case.  It understands the arithmetic functions 
++, -, *, /, %, ^, max, min, abs, sin, cos, tan, atan, exp, log and sqrt, the 
+INPUTn variables and PI.  Programs using anything else, such as functions 
+defined in a lisp environment file, are passed through to lisp as usual.
+
+
+Fitness Evaluation (--fitness-evaluation)
+-----------------------------------------
+Evaluate fitness using the specified method.
+
+Available methods are:
+
+* STANDARD
+* VECTORIZED
+* SHARED=<megabytes>
+* CHUNKED=<rows>
+* COMPILED
+* BATCH
+* POOL=<size>
+* REMOTE=<host:port>,<host:port>,...
+
+The STANDARD method (the default) evaluates each program once for every 
+input.  The VECTORIZED method evaluates each program once over the whole 
+input set using NumPy array operations, which is much faster for large 
+input sets.  It only applies to the OUTPUT deviance-calculation method and 
+only to programs built from the functions understood by the PYTHON 
+interpreter (see Interpreter above); other programs are evaluated one input 
+at a time as usual.  As with the STANDARD method, a program which causes an 
+arithmetic error on any input is punished.
+
+The SHARED method works like the VECTORIZED method, but takes advantage of 
+the subtrees that crossover and replication leave shared between the 
+programs of a generation.  Each distinct subtree is evaluated over the 
+input set once, and the results are kept for other programs which contain 
+it, using at most the specified number of megabytes.  The more the 
+population has converged, the bigger the saving.
+
+The CHUNKED method also works like the VECTORIZED method, but streams the 
+input set through the specified number of rows at a time, accumulating raw 
+fitness and hits block by block.  Each block is evaluated for the whole 
+generation before moving on, so memory use stays bounded however many 
+fitness cases there are.  Use it with --dataset-cache for input sets which 
+are too big to hold in memory; they are then memory mapped and read once 
+per generation.
+
+The COMPILED method sends the input and output sets to the lisp 
+interpreter once, where they stay resident.  Each program is then compiled 
+by lisp and run on every input in a single request, rather than one request 
+per input.  It works with any deviance-calculation method, but only the 
+OUTPUT and LISP-FUNCTION methods benefit from it.
+
+The BATCH method goes further and has all of the programs of a generation 
+evaluated in a single request.  It applies to the OUTPUT and LISP-FUNCTION 
+deviance-calculation methods.
+
+The POOL method works like the BATCH method, but divides the programs of 
+each generation between a pool of interpreters of the specified size which 
+evaluate them in parallel, one process each.  Use a size no larger than the 
+number of processors available.  Each interpreter in the pool is 
+initialized with the lisp environment file, if one is specified.  The pool 
+is always of CLISP interpreters, even with --interpreter PYTHON, since 
+Python interpreters in one process would evaluate one at a time.
+
+The REMOTE method works like the POOL method, but the programs are sent to 
+worker processes at the specified addresses, which may be on other 
+machines.  Start a worker on each machine, from the charlemagne directory, 
+with::
+
+    $ CHARLEMAGNE_SECRET=<secret> python remote.py [host:]<port> [CLISP|PYTHON]
+
+The worker listens on the given port (of localhost by default) and 
+evaluates programs with the given interpreter.  Run one worker per 
+processor.  The input and output sets are sent to each worker once and 
+kept there.  The workers are initialized with the lisp environment file, if 
+one is specified, so it must be at the same path on every machine.
+
+Workers evaluate whatever lisp they are sent, and lisp can run shell 
+commands, so the coordinating run must have the same CHARLEMAGNE_SECRET in 
+its environment, and workers refuse requests without it.  The secret is 
+sent in the clear, so never expose a worker's port to an untrusted 
+network: listen on localhost, or on a private cluster network behind a 
+firewall.
+
+
+Breeding (--breeding)
+---------------------
+Breed the population using the specified method.
+
+Available methods are:
+
+* GENERATIONAL
+* STEADY-STATE=<size>
+
+The GENERATIONAL method (the default) breeds a whole new generation before 
+any of it is evaluated.  The STEADY-STATE method evaluates each new program 
+as soon as it is bred and puts it straight into the population, in place 
+of the least fit of the specified number of randomly chosen programs.  Its 
+offspring can be selected as parents at once.  A generation is then as many 
+insertions as there are programs.  If force-best is set, the best program 
+is never replaced.
+
+
+Islands (--islands)
+-------------------
+Breed the population on the specified number of islands.  Each island is 
+a separate population of the configured size, bred in its own process 
+with its own interpreter.  Once configured, the islands are bred from an 
+interactive session with::
+
+    >>> from charlemagne.island import Archipelago
+    >>> Archipelago(pop.getEnvironment(), lsp.__class__).breed()
+
+Breeding stops as soon as any island finds a solution; an optional number 
+of generations stops it sooner.  The best program of each island is 
+returned, fittest first.  If an island fails with an error, or its process 
+dies, the other islands are stopped and breed raises IslandException.
+
+
+Migration (--migration)
+-----------------------
+Migrate programs between islands using the specified topology.
+
+Available topologies are:
+
+* RING=<interval>
+* RANDOM=<interval>
+
+Every interval generations, each island sends copies of its best programs 
+to another island, where they replace the least fit programs.  With the 
+RING topology each island always sends to the next, the last sending to 
+the first.  With the RANDOM topology each migration goes to a randomly 
+chosen island.
+
+
+Migrants (--migrants)
+---------------------
+Send the specified number of best programs from each island per migration.
+
 """
@@ -232,13 +232,17 @@ class StringParameter(ValueParameter):
         return valid
 
 class Keyword(object):
-    """Represents a keyword, possibly with an associated value"""
+    """Represents a keyword, possibly with an associated value
+
+    If a minimum is given, smaller values don't match.
+    """
     
-    __slots__ = ['_word', '_prop']
+    __slots__ = ['_word', '_prop', '_minimum']
     
-    def __init__(self, word, prop=None):
+    def __init__(self, word, prop=None, minimum=None):
         self._word = word
         self._prop = prop
+        self._minimum = minimum
     
     def toString(self):
         s = self._word
@@ -253,8 +257,8 @@ class Keyword(object):
             if len(input) > 1:
                 if self._prop:
                     try:
-                        self._prop(input[1])
-                        match = 1
+                        value = self._prop(input[1])
+                        match = self._minimum is None or value >= self._minimum
                     except ValueError:
                         match = 0
                 else:
@@ -517,6 +521,16 @@ class TwoArgsParameter(ListParameter):
         if self.__value__ <> None:
             env.twoargs = self.__value__.split(",")
             
+class DatasetCacheParameter(BooleanParameter):
+    def __init__(self):
+        Parameter.__init__(self,
+                           "Dataset Cache",
+                           "Memory map inputs and outputs files from a binary cache",
+                           0, "dataset-cache")
+
+    def apply(self, env):
+        env.setDatasetCache(self.__value__)
+
 class InputsFileParameter(FileParameter):
     def __init__(self):
         FileParameter.__init__(self, "Inputs File", 
@@ -549,7 +563,9 @@ class VocabularyFileParameter(FileParameter):
 class SelectionMethodParameter(KeywordParameter):
     def __init__(self):
         keywords = [ Keyword("FITNESS-PROPORTIONATE",float),
-                     Keyword("TOURNAMENT",int) ]
+                     Keyword("TOURNAMENT",int),
+                     Keyword("ROULETTE-WHEEL"),
+                     Keyword("STOCHASTIC-UNIVERSAL") ]
         KeywordParameter.__init__(self, "Selection Method",
                                   "Use specified selection method",
                                   1, "selection", None, "FITNESS-PROPORTIONATE=0.9",
@@ -561,6 +577,10 @@ class SelectionMethodParameter(KeywordParameter):
             env.useFitnessProportionateSelection(float(tmp[1]))
         elif tmp[0] == "TOURNAMENT":
             env.useTournamentSelection(int(tmp[1]))
+        elif tmp[0] == "ROULETTE-WHEEL":
+            env.useRouletteWheelSelection()
+        elif tmp[0] == "STOCHASTIC-UNIVERSAL":
+            env.useStochasticUniversalSelection()
         else:
             raise BadParameterException
 
@@ -571,6 +591,13 @@ class InputSubsetSizeParameter(IntParameter):
                            "Evaluate fitness based on a random subset of the inputs of the specified size",
                            0, "input-subset")
 
+    def validate(self, input):
+        return IntParameter.validate(self, input) and int(input) >= 1
+
+    def apply(self, env):
+        if self.__value__ <> None:
+            env.setInputSubsetSize(self.__value__)
+
 class FitnessEnvironmentFileParameter(FileParameter):
     def __init__(self):
         Parameter.__init__(self, 
@@ -604,6 +631,37 @@ class ForceBestParameter(IntParameter):
     def apply(self, env):
         env.setForceBest(self.__value__)
 
+class SimplifyParameter(BooleanParameter):
+    def __init__(self):
+        Parameter.__init__(self,
+                           "Simplify",
+                           "Fold constants and apply safe identities in bred programs",
+                           0, "simplify")
+
+    def apply(self, env):
+        env.setSimplification(self.__value__)
+
+class RacingParameter(BooleanParameter):
+    def __init__(self):
+        Parameter.__init__(self,
+                           "Racing",
+                           "Stop evaluating offspring once they are worse than the population",
+                           0, "racing")
+
+    def apply(self, env):
+        env.setRacing(self.__value__)
+
+class FitnessCacheParameter(IntParameter):
+    def __init__(self):
+        Parameter.__init__(self, 
+                           "Fitness Cache", 
+                           "Cache the fitness of the specified number of programs",
+                           0, "fitness-cache", None)
+
+    def apply(self, env):
+        if self.__value__ <> None:
+            env.setFitnessCacheSize(self.__value__)
+
 class PrecisionParameter(FloatParameter):
     def __init__(self):
         Parameter.__init__(self, 
@@ -672,3 +730,123 @@ class DevianceCalculationParameter(KeywordParameter):
             env.usePythonClassDevianceCalculation(tmp[0],tmp[1])
         else:
             raise BadParameterException
+
+class InterpreterParameter(KeywordParameter):
+    def __init__(self):
+        keywords = [ Keyword("CLISP"),
+                     Keyword("PYTHON")
+                   ]
+        KeywordParameter.__init__(self,
+                                  "Interpreter",
+                                  "Evaluate programs using the specified interpreter",
+                                  1, "interpreter", None, "CLISP",
+                                  keywords)
+
+    def apply(self, env):
+        # the interpreter is chosen by Application before configuration
+        pass
+
+class FitnessEvaluationParameter(KeywordParameter):
+    def __init__(self):
+        keywords = [ Keyword("STANDARD"),
+                     Keyword("VECTORIZED"),
+                     Keyword("SHARED", int),
+                     Keyword("CHUNKED", int, 1),
+                     Keyword("COMPILED"),
+                     Keyword("BATCH"),
+                     Keyword("POOL", int, 1),
+                     Keyword("REMOTE", str)
+                   ]
+        KeywordParameter.__init__(self,
+                                  "Fitness Evaluation",
+                                  "Evaluate fitness using the specified method",
+                                  1, "fitness-evaluation", None, "STANDARD",
+                                  keywords)
+
+    def apply(self, env):
+        tmp = self.__value__.split('=')
+        method = tmp[0]
+        if method=="STANDARD":
+            env.useStandardFitnessEvaluation()
+        elif method=="VECTORIZED":
+            env.useVectorizedFitnessEvaluation()
+        elif method=="SHARED":
+            env.useSharedSubtreeFitnessEvaluation(int(tmp[1]) * 1024 * 1024)
+        elif method=="CHUNKED":
+            env.useChunkedFitnessEvaluation(int(tmp[1]))
+        elif method=="COMPILED":
+            env.useCompiledFitnessEvaluation()
+        elif method=="BATCH":
+            env.useBatchFitnessEvaluation()
+        elif method=="POOL":
+            env.usePooledFitnessEvaluation(int(tmp[1]))
+        elif method=="REMOTE":
+            env.useRemoteFitnessEvaluation(tmp[1].split(','))
+        else:
+            raise BadParameterException
+
+class BreedingParameter(KeywordParameter):
+    def __init__(self):
+        keywords = [ Keyword("GENERATIONAL"),
+                     Keyword("STEADY-STATE", int, 1)
+                   ]
+        KeywordParameter.__init__(self,
+                                  "Breeding",
+                                  "Breed generations or insert offspring as they are bred",
+                                  1, "breeding", None, "GENERATIONAL",
+                                  keywords)
+
+    def apply(self, env):
+        tmp = self.__value__.split('=')
+        if tmp[0] == "GENERATIONAL":
+            env.useGenerationalBreeding()
+        elif tmp[0] == "STEADY-STATE":
+            env.useSteadyStateBreeding(int(tmp[1]))
+        else:
+            raise BadParameterException
+
+class IslandsParameter(IntParameter):
+    def __init__(self):
+        Parameter.__init__(self,
+                           "Islands",
+                           "Breed the population on the specified number of islands",
+                           1, "islands", None, 1)
+
+    def validate(self, input):
+        return IntParameter.validate(self, input) and int(input) >= 1
+
+    def apply(self, env):
+        env.setIslands(self.__value__)
+
+class MigrationParameter(KeywordParameter):
+    def __init__(self):
+        keywords = [ Keyword("RING", int, 1),
+                     Keyword("RANDOM", int, 1)
+                   ]
+        KeywordParameter.__init__(self,
+                                  "Migration",
+                                  "Migrate between islands with the specified topology and interval",
+                                  1, "migration", None, "RING=10",
+                                  keywords)
+
+    def apply(self, env):
+        tmp = self.__value__.split('=')
+        if tmp[0] == "RING":
+            env.useRingMigration(int(tmp[1]))
+        elif tmp[0] == "RANDOM":
+            env.useRandomMigration(int(tmp[1]))
+        else:
+            raise BadParameterException
+
+class MigrantsParameter(IntParameter):
+    def __init__(self):
+        Parameter.__init__(self,
+                           "Migrants",
+                           "Send the specified number of best programs per migration",
+                           1, "migrants", None, 1)
+
+    def validate(self, input):
+        return IntParameter.validate(self, input) and int(input) >= 1
+
+    def apply(self, env):
+        env.setMigrants(self.__value__)
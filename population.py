@@ -13,13 +13,19 @@ import random
 import sys
 import os
 import string
+import numpy
 from program import Program
 from program import ConsoleProgram
+from fitnessevaluator import PUNISHMENT
 from exception import NaughtyExpression
 from exception import GeneticOperationException
 from exception import IllegalStateException
 from exception import UnimplementedVirtualMethod
 
+# in racing mode with generational breeding, offspring stop being evaluated
+# once they are worse than this percentage of the last generation
+RACING_PERCENTILE = 90
+
 class Population(list):
 
     """Represents a population of GPs
@@ -30,7 +36,9 @@ class Population(list):
     __slots__ = [
             '_environment','_interpreter','_generation',
             '_totaldepth','_deepestdepth','_adjustedfitnesssum',
-            '_bestindividual','_worstindividual'
+            '_best','_worst',
+            '_rawfitness','_adjustedfitness','_hits','_depth','_size',
+            '_bounded'
             ]
             #,'_programs'
 
@@ -38,39 +46,84 @@ class Population(list):
         self._generation = 0
         self._environment = env
         self._interpreter = interpreter
+        self._resetStats()
         
     def __setitem__(self, index, item):
         list.__setitem__(self, index, item)
         self._resetStats()        
         
     def _resetStats(self):
-        self._bestindividual = None
-        self._worstindividual = None
+        self._best = None
+        self._worst = None
         self._adjustedfitnesssum = None
         self._deepestdepth = 0
         self._totaldepth = 0
+        self._rawfitness = numpy.zeros(0)
+        self._adjustedfitness = numpy.zeros(0)
+        self._hits = numpy.zeros(0, int)
+        self._depth = numpy.zeros(0, int)
+        self._size = numpy.zeros(0, int)
+        self._bounded = numpy.zeros(0, bool)
 
     def _updateStats(self):
-        highest, lowest = 0, 1
-        naughty = []
-        self._deepestdepth, self._totaldepth = 0,0
-        self._adjustedfitnesssum = 0
-        for p in self:
-            self._environment.fitnessevaluator.evaluate(p)
-            self._totaldepth = self._interpreter.depth(p.lisp) + self._totaldepth
-            if (self._interpreter.depth(p.lisp) > self._deepestdepth):
-                self._deepestdepth = self._interpreter.depth(p.lisp)
-            else:
-                if (p.adjustedFitness() > highest):
-                    self._bestindividual = p
-                    highest = p.adjustedFitness()
-                if (p.adjustedFitness() < lowest):
-                    self._worstindividual = p
-                    lowest = p.adjustedFitness()
-                self._adjustedfitnesssum = self._adjustedfitnesssum + p.adjustedFitness()
+        """Evaluate the Programs and update the statistics
+
+        Only Programs whose fitness is not yet known are evaluated; elites,
+        replicas and other offspring identical to a parent keep their fitness.
+        The fitness, hits, depth and size of the Programs are gathered into
+        arrays indexed like the list, and the statistics are reductions over
+        those arrays.  Bounded Programs have adjusted fitness 0, as
+        Program.adjustedFitness.
+        """
+        unevaluated = [p for p in self if p.getRawFitness() is None]
+        self._environment.fitnessevaluator.evaluateAll(unevaluated)
+        n = len(self)
+        rawfitness = numpy.zeros(n)
+        hits = numpy.zeros(n, int)
+        depth = numpy.zeros(n, int)
+        size = numpy.zeros(n, int)
+        bounded = numpy.zeros(n, bool)
+        for i in range(n):
+            p = self[i]
+            rawfitness[i] = p.getRawFitness()
+            hits[i] = p.getHits()
+            depth[i] = p.getDepth()
+            size[i] = p.getSize()
+            bounded[i] = p.isBounded()
             self._statsUpdateOccured()
+        self._rawfitness = rawfitness
+        self._adjustedfitness = numpy.where(bounded, 0.0,
+                                            1.0 / (1.0 + numpy.abs(rawfitness)))
+        self._hits = hits
+        self._depth = depth
+        self._size = size
+        self._bounded = bounded
+        self._best = int(numpy.argmax(self._adjustedfitness))
+        self._worst = int(numpy.argmin(self._adjustedfitness))
+        self._adjustedfitnesssum = float(self._adjustedfitness.sum())
+        self._deepestdepth = int(depth.max())
+        self._totaldepth = int(depth.sum())
+        self._setRacingBound()
+        if self._environment.programselector <> None:
+            self._environment.programselector.prepare(self)
         self._statsUpdated()
 
+    def _setRacingBound(self):
+        """In racing mode, stop evaluating programs worse than most of this generation
+
+        The bound is the RACING_PERCENTILE percentile of the raw fitness of
+        the fully evaluated programs.  Punished programs are left out, and
+        so are bounded ones, whose raw fitness is just a lower estimate.
+        """
+        if self._environment.getRacing():
+            raw = self._rawfitness[~self._bounded]
+            raw = raw[raw <> PUNISHMENT]
+            if len(raw) == 0:
+                bound = None
+            else:
+                bound = float(numpy.percentile(raw, RACING_PERCENTILE))
+            self._environment.fitnessevaluator.setBound(bound)
+
     def _makeProgram(self, lisp):
         """Factory method for instantiating Programs
 
@@ -140,7 +193,7 @@ class Population(list):
         """
         filename = "output/" + self._environment.name + "-sol.lsp"
         file = open(filename, 'w')
-        file.write(self._bestindividual.lisp + "\n")
+        file.write(self.getBestProgram().lisp + "\n")
         file.close()
 
     def show(self):
@@ -165,6 +218,7 @@ class Population(list):
             self.append(p)
             self._populateOccured()
         self._resetStats()
+        self._environment.refreshInputSubset()
         self._updateStats()
         
     #def add(self, p):
@@ -181,9 +235,19 @@ class Population(list):
 
     def next(self):
         """Breed the programs to create the next generation"""
+        if self._environment.getBreeding() == "STEADY-STATE":
+            self._steadyStateNext()
+            return
+        parents = []
+        def select_():
+            # parents are selected in bulk, as many as are still needed
+            if len(parents) == 0:
+                n = max(2, self._environment.getPopulationSize() - len(newpop))
+                parents.extend(self._environment.programselector.selectMany(self, n))
+            return parents.pop()
         def crossover_(newpop):
-            parent1 = self._environment.programselector.select(self)
-            parent2 = self._environment.programselector.select(self)
+            parent1 = select_()
+            parent2 = select_()
             try:
                 children = parent1.crossover(parent2)
                 if len(newpop) < self._environment.getPopulationSize():
@@ -196,8 +260,8 @@ class Population(list):
                 pass
             return newpop
         def csCrossover_(newpop):
-            parent1 = self._environment.programselector.select(self)
-            parent2 = self._environment.programselector.select(self)
+            parent1 = select_()
+            parent2 = select_()
             try:
                 children = parent1.contextSensitiveCrossover(parent2)
                 if len(newpop) < self._environment.getPopulationSize():
@@ -212,7 +276,7 @@ class Population(list):
         def mutate_(newpop):
             if len(newpop) < self._environment.getPopulationSize():
                 try:
-                    newpop.append(self._environment.programselector.select(self).mutant())
+                    newpop.append(select_().mutant())
                     self._mutateOccured()
                 except NaughtyExpression:
                     pass
@@ -220,7 +284,7 @@ class Population(list):
         def replicate_(newpop):
             if len(newpop) < self._environment.getPopulationSize():
                 try:
-                    newpop.append(self._environment.programselector.select(self).replica())
+                    newpop.append(select_().replica())
                     self._replicateOccured()
                 except NaughtyExpression:
                     pass
@@ -228,7 +292,7 @@ class Population(list):
     
         newpop = []
         for i in range(self._environment.getForceBest()):
-            newpop.append(self._bestindividual)
+            newpop.append(self.getBestProgram())
             self._forceBestOccured()
 
         size = self._environment.getPopulationSize()
@@ -255,8 +319,119 @@ class Population(list):
         self._resetStats()
         #self.save()
         self._generation += 1
+        self._refreshInputSubset()
         self._updateStats()
+
+    def _refreshInputSubset(self):
+        """Draw a new input subset, if one is in use, and forget fitness measured on the last
+
+        Returns true if a new subset was drawn.
+        """
+        if not self._environment.refreshInputSubset():
+            return 0
+        # raw fitness on the last subset is no bound on raw fitness on this one
+        self._environment.fitnessevaluator.setBound(None)
+        for p in self:
+            p.setRawFitness(None)
+            p.setHits(None)
+            p.setBounded(0)
+        return 1
         
+    def _steadyStateNext(self):
+        """Breed a generation's worth of programs, inserting each as it is bred
+
+        Offspring can be selected as parents as soon as they are inserted.
+        Selectors which prepare tables from the fitness array only see the
+        insertions at the end of the generation.
+        """
+        if self._refreshInputSubset():
+            self._updateStats()
+        select = self._environment.programselector.select
+        size = self._environment.getPopulationSize()
+        inserted = 0
+        while (inserted < size):
+            stdCrossover = self._environment.getCrossoverP()
+            csCrossover  = self._environment.getCSCrossoverP() + stdCrossover
+            mutate       = self._environment.getMutateP()      + csCrossover
+            replica      = self._environment.getReplicateP()   + mutate
+            rnd = random.random()
+            if (rnd <= stdCrossover):
+                children = select(self).crossover(select(self))
+                occured = self._crossoverOccured
+            elif (rnd <= csCrossover):
+                children = select(self).contextSensitiveCrossover(select(self))
+                occured = self._contextSensitiveCrossoverOccured
+            elif (rnd <= mutate):
+                children = [select(self).mutant()]
+                occured = self._mutateOccured
+            elif (rnd <= replica):
+                children = [select(self).replica()]
+                occured = self._replicateOccured
+            else:
+                raise GeneticOperationException
+            for child in children[:size - inserted]:
+                if self._insert(child):
+                    inserted += 1
+                    occured()
+
+        self._adjustedfitnesssum = float(self._adjustedfitness.sum())
+        self._generation += 1
+        self._setRacingBound()
+        if self._environment.programselector <> None:
+            self._environment.programselector.prepare(self)
+        self._statsUpdated()
+
+    def _insert(self, child):
+        """Evaluate a program and put it in place of the loser of an inverse tournament
+
+        The stats arrays and aggregates are updated for the one replaced
+        program.  The best program is not replaced if force-best is set.
+        In racing mode the program races the loser: its evaluation stops,
+        and it is dropped, as soon as it is worse than the loser.  Bounded
+        programs have adjusted fitness 0, so they lose the inverse
+        tournament to any fully evaluated program.  Returns true if the
+        program was inserted.
+        """
+        adjusted = self._adjustedfitness
+        entrants = numpy.random.randint(0, len(self),
+                        self._environment.getReplacementTournamentSize())
+        i = int(entrants[numpy.argmin(adjusted[entrants])])
+        if i == self._best and self._environment.getForceBest():
+            return 0
+        if child.getRawFitness() is None:
+            evaluator = self._environment.fitnessevaluator
+            if self._environment.getRacing() and not self._bounded[i]:
+                evaluator.setBound(float(self._rawfitness[i]))
+                evaluator.evaluate(child)
+                if child.isBounded():
+                    return 0
+            else:
+                evaluator.setBound(None)
+                evaluator.evaluate(child)
+        list.__setitem__(self, i, child)
+        olddepth = self._depth[i]
+        self._totaldepth += child.getDepth() - olddepth
+        self._adjustedfitnesssum += child.adjustedFitness() - adjusted[i]
+        self._rawfitness[i] = child.getRawFitness()
+        adjusted[i] = child.adjustedFitness()
+        self._hits[i] = child.getHits()
+        self._depth[i] = child.getDepth()
+        self._size[i] = child.getSize()
+        self._bounded[i] = child.isBounded()
+        if child.getDepth() >= self._deepestdepth:
+            self._deepestdepth = child.getDepth()
+        elif olddepth == self._deepestdepth:
+            self._deepestdepth = int(self._depth.max())
+        if i == self._best:
+            self._best = int(numpy.argmax(adjusted))
+        elif adjusted[i] > adjusted[self._best]:
+            self._best = i
+        if i == self._worst:
+            self._worst = int(numpy.argmin(adjusted))
+        elif adjusted[i] < adjusted[self._worst]:
+            self._worst = i
+        return 1
+
     def breed(self):
         """Breed the programs until a solution is found"""
         done = 0
@@ -264,11 +439,46 @@ class Population(list):
         if not os.path.exists("output"):
             os.mkdir("output")
         while (not done):
-            done = (self._bestindividual.getHits() == self._environment.inputCount())
+            done = self.isSuccessful()
             if not done:
                 self.next()
         self._solutionFound()
 
+    def isSuccessful(self):
+        """Returns true if the best Program scores a hit on every input
+
+        When fitness is evaluated on an input subset, a best Program which
+        scores a hit on every input of the subset is evaluated on the whole
+        input set before it is accepted.
+        """
+        if self._best is None:
+            return 0
+        env = self._environment
+        if self._hits[self._best] <> env.fitnessCaseCount():
+            return 0
+        if env.fitnessCaseCount() == env.inputCount():
+            return 1
+        candidate = self._makeProgram(self[self._best].tree)
+        env.evaluateOnAllInputs(candidate)
+        return candidate.getHits() == env.inputCount()
+
+    def getFittest(self, n):
+        """Returns the n fittest Programs, fittest first"""
+        order = numpy.argsort(-self._adjustedfitness, kind='mergesort')
+        return [self[i] for i in order[:n]]
+
+    def immigrate(self, immigrants):
+        """Replace the least fit Programs with immigrants
+
+        immigrants is a list of lisp expressions.  The best Program is never
+        replaced.  The immigrants are evaluated and the stats updated.
+        """
+        order = numpy.argsort(self._adjustedfitness, kind='mergesort')
+        worst = [i for i in order if i <> self._best][:len(immigrants)]
+        for i, lisp in zip(worst, immigrants):
+            list.__setitem__(self, i, self._makeProgram(lisp))
+        self._updateStats()
+
     def save(self):
         """Save the current population to the file provided"""
         name = self._environment.getRunName()
@@ -305,16 +515,40 @@ class Population(list):
         
     def getBestProgram(self):
         """The best Program in the list"""
-        return self._bestindividual
+        if self._best is None:
+            return None
+        return self[self._best]
 
     def getWorstProgram(self):
         """The worst Program in the list"""
-        return self._worstindividual
+        if self._worst is None:
+            return None
+        return self[self._worst]
 
     def getAdjustedFitnessSum(self):
         """The sum of the adjusted fitnesses of all Programs in list"""
         return self._adjustedfitnesssum
 
+    def getRawFitnessArray(self):
+        """The raw fitnesses of the Programs as a numpy array, in list order"""
+        return self._rawfitness
+
+    def getAdjustedFitnessArray(self):
+        """The adjusted fitnesses of the Programs as a numpy array, in list order"""
+        return self._adjustedfitness
+
+    def getHitsArray(self):
+        """The hits of the Programs as a numpy array, in list order"""
+        return self._hits
+
+    def getDepthArray(self):
+        """The depths of the Programs as a numpy array, in list order"""
+        return self._depth
+
+    def getSizeArray(self):
+        """The sizes of the Programs as a numpy array, in list order"""
+        return self._size
+
     def getAverageDepth(self):
         """Reports the average depth of the population"""
         return float(self._totaldepth) / float(len(self))
@@ -355,8 +589,8 @@ class ConsolePopulation(Population):
         """Print the stats of the current generation
         
         """
-        best = self._bestindividual
-        worst = self._worstindividual
+        best = self.getBestProgram()
+        worst = self.getWorstProgram()
         aaf = self._adjustedfitnesssum/len(self)
         sys.stdout.write("\n")
         sys.stdout.write("Generation " +\
@@ -369,13 +603,19 @@ class ConsolePopulation(Population):
         sys.stdout.write("----\n")
         sys.stdout.write(":Lisp: " + best.lisp + "\n")
         sys.stdout.write(":Adjusted Fitness: " +\
-                         str(best.adjustedFitness()) + "\n")
-        sys.stdout.write(":Hits: " + str(best.getHits()) + "\n")
+                         str(self._adjustedfitness[self._best]) + "\n")
+        sys.stdout.write(":Hits: " + str(self._hits[self._best]) + "\n")
         sys.stdout.write("\nWorst\n")
         sys.stdout.write("-----\n")
         sys.stdout.write(":Lisp: " + worst.lisp + "\n")
         sys.stdout.write(":Adjusted Fitness: " +\
-                         str(worst.adjustedFitness()) + "\n")
+                         str(self._adjustedfitness[self._worst]) + "\n")
+        cache = self._environment.fitnessevaluator.getCache()
+        if cache <> None:
+            sys.stdout.write("\nFitness Cache\n")
+            sys.stdout.write("-------------\n")
+            sys.stdout.write(":Hits: " + str(cache.getHits()) + "\n")
+            sys.stdout.write(":Misses: " + str(cache.getMisses()) + "\n")
         sys.stdout.flush()
         
     def show(self):
@@ -8,43 +8,54 @@ Charlemagne is distributed under the GNU General Public License.  See
 the file LICENSE.txt in the distribution for details.
 """
 
-from pylisp import lisputil
 import random
 import random
-import string
-import math
 import sys
 
 from exception import NaughtyExpression
 from exception import IllegalStateException
 from exception import UnimplementedVirtualMethod
+from programtree import ProgramTree
+from programtree import fromLisp
+from programtree import randomTree
 
 class Program(object):
     """A genetic program
 
     A Program has a lisp expression associated with it which dictates its
-    behavior and therefore fitness.
+    behavior and therefore fitness.  The expression is held as a ProgramTree
+    and only converted to a lisp string when it is first needed.
     """
 
     __slots__ = [
-            '_environment','_interpreter','_lisp',
-            '_rawfitness','_depth','_hits'
+            '_environment','_interpreter','_tree','_lisp',
+            '_rawfitness','_depth','_size','_hits','_bounded'
             ]
 
     def __init__(self, env, interpreter, lisp="()"):
         """Create a Program
 
         You must provide a Charlemagne environment and optionally an initial
-        lisp expression."""
+        lisp expression, as a string or a ProgramTree."""
         self._environment = env
         self._interpreter = interpreter
-        self._lisp = lisp
-        self._resetStats()
+        self.setLisp(lisp)
 
     def _resetStats(self):
         self._rawfitness = None
-        self._depth = None
         self._hits = None
+        self._bounded = 0
+        self._measure()
+
+    def _measure(self):
+        """Calculate the depth and size of the lisp expression
+
+        These never change for a given expression, so they are calculated
+        locally once, when the expression is set, rather than queried from
+        the interpreter each time they are needed.
+        """
+        self._depth = self._tree.depth()
+        self._size = len(self._tree)
 
     def _makeProgram(self, lisp):
         """Factory method for instantiating programs
@@ -53,6 +64,16 @@ class Program(object):
         """
         return Program(self._environment, self._interpreter, lisp)
         
+    def _makeOffspring(self, tree):
+        """Make a program from a tree bred from this one
+
+        The offspring is simplified if the environment says so.
+        """
+        offspring = self._makeProgram(tree)
+        if self._environment.getSimplification():
+            offspring.simplify()
+        return offspring
+
     def show(self):
         """Abstract method for displaying the program
         
@@ -61,16 +82,36 @@ class Program(object):
         raise UnimplementedVirtualMethod
 
     def getLisp(self):
-        """Retrieve the lisp source of the program"""
+        """Retrieve the lisp source of the program
+
+        The source is rendered from the tree once and kept until the tree
+        changes.
+        """
+        if self._lisp is None:
+            self._lisp = self._tree.toLisp()
         return self._lisp
 
     def setLisp(self, lisp):
-        """Set the lisp source of the program"""
-        self._lisp = lisp
+        """Set the lisp source of the program
+
+        lisp can be a string or a ProgramTree.  Raises UnsupportedExpression
+        if a string is not a program expression.
+        """
+        if isinstance(lisp, ProgramTree):
+            self._tree = lisp
+        else:
+            self._tree = fromLisp(lisp)
+        self._lisp = None
         self._resetStats()
 
     lisp = property(getLisp, setLisp, None, "the lisp expression")
 
+    def getTree(self):
+        """Retrieve the ProgramTree of the program"""
+        return self._tree
+
+    tree = property(getTree, None, None, "the program tree")
+
     def getRawFitness(self):
         """Returns the raw fitness of the program
 
@@ -91,8 +132,7 @@ class Program(object):
     def getDepth(self):
         """Returns the depth of the lisp expression
 
-        Note the program needs to have been evaluated by a ProgramEvaluator
-        for this to be set.  The Program does not evaluate its own depth.
+        This is calculated when the lisp expression is set.
         """
         return self._depth
 
@@ -100,13 +140,21 @@ class Program(object):
         """Set the depth of the program
 
         Note: this is setting the depth statistic for the program, not altering
-        the lisp expression in any way.  Normally a FitnessEvaluator should be
-        doing this.
+        the lisp expression in any way.
         """
         self._depth = depth
 
     depth = property(getDepth, setDepth)
 
+    def getSize(self):
+        """Returns the number of nodes (possible program branches) in the lisp expression
+
+        This is calculated when the lisp expression is set.
+        """
+        return self._size
+
+    size = property(getSize)
+
     def getHits(self):
         """Get the hits statistic
 
@@ -126,51 +174,84 @@ class Program(object):
 
     hits = property(getHits, setHits)
 
+    def isBounded(self):
+        """Returns true if the raw fitness is only a lower bound
+
+        In racing mode, evaluation stops as soon as a program is known to
+        be worse than every fully evaluated program in the population, and
+        the raw fitness and hits so far are kept.
+        """
+        return self._bounded
+
+    def setBounded(self, bounded):
+        """Set whether the raw fitness is only a lower bound
+
+        Normally a FitnessEvaluator should be doing this.
+        """
+        self._bounded = bounded
+
+    def inheritFitness(self, *parents):
+        """Take the fitness and hits of a parent with the same expression
+
+        Offspring which are identical to a parent need not be evaluated.
+        """
+        for parent in parents:
+            if parent._tree == self._tree:
+                self._rawfitness = parent._rawfitness
+                self._hits = parent._hits
+                self._bounded = parent._bounded
+                return
+
     def adjustedFitness(self):
         """Calculate the adjusted fitness
         
         Note the program needs to have been evaluated by a ProgramEvaluator for
         this to work.  The adjusted fitness is based on the rawfitness of the
-        lisp expression.
+        lisp expression.  A bounded program is known to be worse than every
+        fully evaluated one, but not by how much, so its adjusted fitness is
+        0, below that of any fully evaluated program.
         """
+        if self._bounded:
+            return 0.0
         try:
             a = (1.0 / (1.0 + abs(self._rawfitness)))
         except:
-            print "IllegalStateException for " + self._lisp
+            print "IllegalStateException for " + self.getLisp()
             raise IllegalStateException
         return a
 
     def randomize(self, depth):
-        """Randomize the Program's lisp expression"""
-        terminals = "'" + lisputil.makeList(self._environment.vocabulary[0])
-        onearg = "'" + lisputil.makeList(self._environment.vocabulary[1])
-        twoarg = "'" + lisputil.makeList(self._environment.vocabulary[2])
-        expr = lisputil.makeFunctionCall("random-program", [str(depth), terminals, onearg, twoarg])
-        try:
-            l = self._interpreter.querySolution(expr)
-        except NaughtyExpression:
-            # try again until it works
-            self.randomize(depth)
-        self.setLisp(l)
-        self.replaceConstantSynthesisTokens()
+        """Randomize the Program's lisp expression, as random-program in charlemagne.lsp"""
+        vocabulary = self._environment.vocabulary
+        tree = randomTree(depth, vocabulary[0], vocabulary[1], vocabulary[2])
+        self.setLisp(tree.synthesizeConstants())
+        if self._environment.getSimplification():
+            self.simplify()
 
     def replaceConstantSynthesisTokens(self):
         """Synthesize constants for all CONSTANT-SYNTHESIS token terminals
         
         The terminal CONSTANT-SYNTHESIS is a keyword which is replaced with a
         random constant."""
-        #optimizations
-        lstr = str ; randint = random.randint ; expovariate = random.expovariate ; replace = string.replace
-        lisp = self._lisp ; find = string.find ; pow = math.pow
-        while(find(lisp,"CONSTANT-SYNTHESIS") != -1):
-            lisp = replace(lisp, "CONSTANT-SYNTHESIS", lstr(pow(-1, randint(1,2))*expovariate(1)), 1)
-        self._lisp = lisp
+        self._tree = self._tree.synthesizeConstants()
+        self._lisp = None
+
+    def simplify(self):
+        """Simplify the lisp expression
+
+        Constant subtrees are folded and safe identities applied, as
+        ProgramTree.simplify.  The program computes the same values, so its
+        fitness is kept.
+        """
+        self._tree = self._tree.simplify()
+        self._lisp = None
+        self._measure()
 
     def save(self, file):
         """Save the program to file
         
         Saves the lisp expression as one line in the provided open file."""
-        file.write(self._lisp + "\n")
+        file.write(self.getLisp() + "\n")
 
     def saveStats(self, file):
         """Save the stats
@@ -192,26 +273,25 @@ class Program(object):
 
     def flatCount(self):
         """Return the number of possible program branches in the lisp expression"""
-        expr = "(flat-count '%s)" % self._lisp
-        flatCount = self._interpreter.querySolution(expr)
-        return int(flatCount)
+        return self.getSize()
 
     def crossoverAt(self, mate, branch1, branch2):
         """Perform a crossover operation with another program at specified points on 
         the program trees
+
+        The branches are node offsets, counted depth first from 0.
         """
-        interpreter = self._interpreter
-        expr = "(crossover-at '%s '%s %s %s)" % (self._lisp, mate.lisp, branch1, branch2)
-        # note: this can raise NaughtyExpression, it should be dealt with in the caller
-        children = interpreter.querySolution(expr)
-        q1 = "(car '%s)" % (children)
-        q2 = "(cadr '%s)" % (children)
-        child1 = self._makeProgram(interpreter.querySolution(q1))
-        child2 = self._makeProgram(interpreter.querySolution(q2))
-        if self._interpreter.depth(child1.lisp) > self._environment.maxprogramdepth:
+        tree1 = self._tree ; tree2 = mate.tree
+        child1 = self._makeOffspring(tree1.replace(branch1, tree2.subtree(branch2)))
+        child2 = self._makeOffspring(tree2.replace(branch2, tree1.subtree(branch1)))
+        if child1.depth > self._environment.maxprogramdepth:
             child1 = self
-        if self._interpreter.depth(child2.lisp) > self._environment.maxprogramdepth:
+        else:
+            child1.inheritFitness(self, mate)
+        if child2.depth > self._environment.maxprogramdepth:
             child2 = mate
+        else:
+            child2.inheritFitness(mate, self)
         return [child1] + [child2]
 
     def crossover(self, mate):
@@ -225,72 +305,58 @@ class Program(object):
         """Perform a context sensitive crossover
         
         Perform a crossover operation with another program at specified points
-        on the program trees."""
-        interpreter = self._interpreter
-        #print "Getting a tree path for " + str(self._lisp) +" "+ str(branch)
-        expr = "(tree-path %s '%s)" % (branch,self._lisp)
-        path = interpreter.querySolution(expr)
-        if path=="NIL":
-            path="()"
-        #print "Does the path exist in the mate?" + str(mate.getLisp()) +" "+ path
-        expr = "(path-exists '%s '%s)" % (mate.getLisp(), path)
-        if interpreter.querySolution(expr)=='T':
-            #print "Looks good.  Going ahead with the cscrossover.."
-            expr = "(context-sensitive-crossover-at '%s '%s '%s)" % \
-                            (self._lisp, mate.getLisp(), path)
-            #print expr
-            children = interpreter.querySolution(expr)
-            ok = 1
-            #print "OK: " + children
-        else:
-            #replicate for now
-            #print "Mate is incompatible."
+        on the program trees.  The subtrees at the same path from the root are
+        swapped; branches 0 and 1 are both the root, as in tree-path.  If the
+        mate has no node on the path, a standard crossover is done instead."""
+        tree1 = self._tree ; tree2 = mate.tree
+        path = tree1.path(max(branch - 1, 0))
+        j = tree2.find(path)
+        if j is None:
             return self.crossover(mate)
-            #children = "(%s %s)" % (self._lisp, mate.getLisp())
-            #print children
-        if ok:
-            q1 = "(car '%s)" % (children)
-            q2 = "(cadr '%s)" % (children)
-            child1 = self._makeProgram(interpreter.querySolution(q1))
-            child2 = self._makeProgram(interpreter.querySolution(q2))
-            if child1.getLisp()[-4:] == "NIL)":
-                print self._lisp
-                print mate.getLisp()
-                print branch
-                print child1.getLisp()
-                print child2.getLisp()
-                sys.exit()
-            if self._interpreter.depth(child1.lisp) > self._environment.maxprogramdepth:
-                child1 = self
-            if self._interpreter.depth(child2.lisp) > self._environment.maxprogramdepth:
-                child2 = mate
-            return [child1] + [child2]
+        i = tree1.find(path)
+        child1 = self._makeOffspring(tree1.replace(i, tree2.subtree(j)))
+        child2 = self._makeOffspring(tree2.replace(j, tree1.subtree(i)))
+        if child1.depth > self._environment.maxprogramdepth:
+            child1 = self
+        else:
+            child1.inheritFitness(self, mate)
+        if child2.depth > self._environment.maxprogramdepth:
+            child2 = mate
         else:
-            return []
+            child2.inheritFitness(mate, self)
+        return [child1] + [child2]
 
     def contextSensitiveCrossover(self, mate):
         """Perform a crossover operation with another program
         """
         branch = random.randint(0, self.flatCount() - 1)
-        try:
-            c = self.contextSensitiveCrossoverAt(mate, branch)
-        except NaughtyExpression:
-            # keep trying until we get a crossover that works.
-            return self.crossover(mate)
-        return c
+        return self.contextSensitiveCrossoverAt(mate, branch)
 
     def mutant(self):
-        """Perform a mutation on the program"""
-        terminals = "'" + lisputil.makeList(self._environment.vocabulary[0])
-        onearg = "'" + lisputil.makeList(self._environment.vocabulary[1])
-        twoarg = "'" + lisputil.makeList(self._environment.vocabulary[2])
-        mutant = self._makeProgram(self._interpreter.querySolution(lisputil.makeFunctionCall("mutate", ["'" + self._lisp] + [str(self._environment.maxprogramdepth), terminals, onearg, twoarg])))
-        mutant.replaceConstantSynthesisTokens()
+        """Perform a mutation on the program
+
+        A random node is replaced with a random program, as mutate in
+        charlemagne.lsp: the replacement's maximum depth is the size of the
+        branch it replaces.
+        """
+        tree = self._tree
+        i = max(random.randint(0, len(tree) - 1) - 1, 0)
+        vocabulary = self._environment.vocabulary
+        branch = randomTree(tree.end(i) - i, vocabulary[0], vocabulary[1], vocabulary[2])
+        mutant = self._makeProgram(tree.replace(i, branch.synthesizeConstants()))
+        if self._environment.getSimplification():
+            mutant.simplify()
+        mutant.inheritFitness(self)
         return mutant
 
     def replica(self):
-        """Replicate the program"""
-        return self._makeProgram(self._lisp)
+        """Replicate the program
+
+        The replica keeps the program's fitness.
+        """
+        replica = self._makeProgram(self._tree)
+        replica.inheritFitness(self)
+        return replica
 
 class ConsoleProgram(Program):
     """A genetic program - extended to provide console output
@@ -308,7 +374,7 @@ class ConsoleProgram(Program):
         
     def show(self):
         """Display the program in text format"""
-        print self._lisp
+        print self.getLisp()
 
     #def deviance(self, n):
     #       """The deviance of the output of p on input n from the output of fitnessExpression on input x"""
@@ -9,6 +9,7 @@ the file LICENSE.txt in the distribution for details.
 """
 
 import random
+import numpy
 
 from exception import NaughtyExpression
 
@@ -18,15 +19,31 @@ class ProgramSelector(object):
 
     """An interface class for selecting a Program from the population"""
 
+    def prepare(self, population):
+        """Called when the fitness of a population has been evaluated
+
+        Selectors which precompute anything from the population's fitness
+        should do it here, once per generation, rather than in select.
+        """
+        pass
+
     def select(self, population):
         pass
 
+    def selectMany(self, population, n):
+        """Select n programs from the population
+
+        By default this calls select n times.
+        """
+        select = self.select
+        return [select(population) for i in range(n)]
+
 class RandomProgramSelector(ProgramSelector):
 
     """A class which selects a program randomly from a population."""
 
     def select(self, population):
-        return population.program(random.randint(0,len(population)-1))
+        return population[random.randint(0,len(population)-1)]
 
 class FitnessProportionateProgramSelector(ProgramSelector):
 
@@ -39,18 +56,20 @@ class FitnessProportionateProgramSelector(ProgramSelector):
         self._fitnessdependence = fitnessDependence
 
     def select(self,population):
+        fitness = population.getAdjustedFitnessArray()
+        average = population.getAverageAdjustedFitness()
+        total = population.getAdjustedFitnessSum()
+        if total <= 0:
+            return population[random.randint(0,len(population)-1)]
         done = 0
         while(done==0):
-            candidate = population[random.randint(0,len(population)-1)]
-            r = random.randint(0,(int(population.getAverageAdjustedFitness()*100000000))) / 100000000.0
-            try:
-                normalizedFitness = candidate.adjustedFitness() / population.getAdjustedFitnessSum()
-            except NaughtyExpression:
-                normalizedFitness = 0
+            i = random.randint(0,len(population)-1)
+            r = random.randint(0,(int(average*100000000))) / 100000000.0
+            normalizedFitness = fitness[i] / total
 
             if (r <= (normalizedFitness * (1.0 - self._fitnessdependence))):
                 done = 1
-        return candidate
+        return population[i]
 
 class TournamentProgramSelector(ProgramSelector):
 
@@ -66,27 +85,94 @@ class TournamentProgramSelector(ProgramSelector):
             self._tournamentsize = tournamentSize
 
     def select(self, population):
-        tournament = []
-        for i in range(self._tournamentsize):
-            tournament.append(population.randomProgram())
-        bestFitness = -1 ; best = None
-        for p in tournament:
-            #try:
-            fitness = p.adjustedFitness()
-            #except:
-            #       fitness = -1 ; tournament.append(population.randomIndividual())
-            if  fitness > bestFitness:
-                best = p
-                bestFitness = fitness
-        return p
+        return self.selectMany(population, 1)[0]
+
+    def selectMany(self, population, n):
+        """Hold n tournaments at once
+
+        Entrants are drawn as an n by tournament size matrix of indexes into
+        the population's adjusted fitness array, and the winner of each row
+        is the entrant with the highest adjusted fitness.
+        """
+        fitness = population.getAdjustedFitnessArray()
+        entrants = numpy.random.randint(0, len(fitness), (n, self._tournamentsize))
+        winners = entrants[numpy.arange(n), numpy.argmax(fitness[entrants], 1)]
+        return [population[i] for i in winners]
         
 class RouletteWheelSelector(ProgramSelector):
 
     """A class which uses a roulette wheel method for selecting individuals from a
     population.
     
-    (The programs will need to be sorted by fitness for this one.)
+    Each program is selected with probability proportional to its adjusted
+    fitness.  An alias table is built from the adjusted fitnesses in prepare,
+    so each selection takes constant time.
     """
     
-    # IMPLEMENTME
-    pass
+    __slots__ = ['_probability', '_alias']
+
+    def __init__(self):
+        self._probability = []
+        self._alias = []
+
+    def prepare(self, population):
+        """Build the alias table for the population (Vose's method)"""
+        n = len(population)
+        weights = population.getAdjustedFitnessArray()
+        total = population.getAdjustedFitnessSum()
+        if total <= 0:
+            weights = numpy.ones(n) ; total = float(n)
+        scaled = list(weights * n / total)
+        probability = [1.0] * n
+        alias = range(n)
+        small = [i for i in range(n) if scaled[i] < 1.0]
+        large = [i for i in range(n) if scaled[i] >= 1.0]
+        while small and large:
+            s = small.pop() ; l = large[-1]
+            probability[s] = scaled[s]
+            alias[s] = l
+            scaled[l] = scaled[l] + scaled[s] - 1.0
+            if scaled[l] < 1.0:
+                small.append(large.pop())
+        self._probability = probability
+        self._alias = alias
+
+    def select(self, population):
+        i = random.randint(0, len(self._probability) - 1)
+        if random.random() < self._probability[i]:
+            return population[i]
+        return population[self._alias[i]]
+
+class StochasticUniversalSelector(ProgramSelector):
+
+    """A class which selects programs with probability proportional to adjusted
+    fitness, by stochastic universal sampling.
+
+    selectMany spaces n pointers evenly around the roulette wheel, so every
+    program is selected within one of its expected number of times.
+    """
+
+    __slots__ = ['_cumulative']
+
+    def __init__(self):
+        self._cumulative = numpy.zeros(0)
+
+    def prepare(self, population):
+        """Build the cumulative adjusted fitness array for the population"""
+        weights = population.getAdjustedFitnessArray()
+        if population.getAdjustedFitnessSum() <= 0:
+            weights = numpy.ones(len(population))
+        self._cumulative = numpy.cumsum(weights)
+
+    def select(self, population):
+        return self.selectMany(population, 1)[0]
+
+    def selectMany(self, population, n):
+        cumulative = self._cumulative
+        step = cumulative[-1] / n
+        pointers = random.uniform(0, step) + step * numpy.arange(n)
+        indexes = numpy.searchsorted(cumulative, pointers, side='right')
+        indexes = numpy.minimum(indexes, len(cumulative) - 1)
+        selected = [population[i] for i in indexes]
+        random.shuffle(selected)
+        return selected
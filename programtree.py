@@ -0,0 +1,442 @@
+"""
+Program tree module
+
+This module is part of Charlemagne
+Copyright (c) Robert Green 2002, 2003
+
+Charlemagne is distributed under the GNU General Public License.  See
+the file LICENSE.txt in the distribution for details.
+"""
+
+import random
+import string
+from array import array
+import numpy
+
+from exception import NaughtyExpression
+from exception import UnsupportedExpression
+from expression import tokenize
+from expression import atom
+from expression import checked
+from expression import ONE_ARGUMENT_FUNCTIONS
+from expression import TWO_ARGUMENT_FUNCTIONS
+
+# the symbol table shared by all trees.  SYMBOLS[opcode] is the symbol with
+# that opcode and OPCODES[symbol] is the opcode of that symbol.  opcode 0 is
+# not used, negative opcodes refer to the constant array of a tree.
+SYMBOLS = [None]
+OPCODES = {}
+
+# the terminal which is replaced with a random constant
+CONSTANT_SYNTHESIS = "CONSTANT-SYNTHESIS"
+
+def opcode(symbol):
+    """Return the opcode of a symbol, adding it to the symbol table if necessary"""
+    try:
+        return OPCODES[symbol]
+    except KeyError:
+        OPCODES[symbol] = len(SYMBOLS)
+        SYMBOLS.append(symbol)
+        return OPCODES[symbol]
+
+class ProgramTree(object):
+    """A lisp expression encoded as arrays in prefix order
+
+    Each node of the expression has an opcode and an argument count.  A
+    symbol's opcode indexes the symbol table, a floating point constant
+    has the negative opcode -(k+1) where k indexes the constant array.
+    The offset just past the end of each node's subtree is precomputed,
+    so the subtree rooted at node i is nodes i up to ends[i]: it can be
+    found in constant time, and replaced by splicing the arrays.
+
+    ProgramTrees are never modified once made.  Operations which change
+    the expression return a new ProgramTree.
+    """
+
+    __slots__ = ['_ops', '_args', '_consts', '_ends']
+
+    def __init__(self, ops=None, args=None, consts=None):
+        if ops is None:
+            ops = array('i') ; args = array('B') ; consts = array('d')
+        self._ops = ops
+        self._args = args
+        self._consts = consts
+        self._ends = self._findEnds()
+
+    def _findEnds(self):
+        ops = self._ops ; args = self._args
+        ends = array('i', ops)
+        stack = []
+        for i in range(len(ops) - 1, -1, -1):
+            end = i + 1
+            for k in range(args[i]):
+                end = stack.pop()
+            ends[i] = end
+            stack.append(end)
+        return ends
+
+    def __len__(self):
+        return len(self._ops)
+
+    def __eq__(self, other):
+        return isinstance(other, ProgramTree) and \
+               self._ops == other._ops and self._args == other._args and \
+               self._consts == other._consts
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash((self._ops.tostring(), self._args.tostring(),
+                     self._consts.tostring()))
+
+    def getOps(self):
+        """Return the opcode array"""
+        return self._ops
+
+    def getArgs(self):
+        """Return the argument count array"""
+        return self._args
+
+    def getConsts(self):
+        """Return the constant array"""
+        return self._consts
+
+    def getEnds(self):
+        """Return the subtree end offset array"""
+        return self._ends
+
+    def end(self, i):
+        """Return the offset just past the end of the subtree at node i"""
+        return self._ends[i]
+
+    def children(self, i):
+        """Return a list of the offsets of the arguments of node i"""
+        children = []
+        c = i + 1
+        for k in range(self._args[i]):
+            children.append(c)
+            c = self._ends[c]
+        return children
+
+    def isConstant(self, i):
+        """Return true if node i is a floating point constant"""
+        return self._ops[i] < 0
+
+    def symbol(self, i):
+        """Return the symbol of node i, which must not be a constant"""
+        return SYMBOLS[self._ops[i]]
+
+    def value(self, i):
+        """Return the value of node i, which must be a constant"""
+        return self._consts[-self._ops[i] - 1]
+
+    def atom(self, i):
+        """Return the lisp text of node i's operator or atom"""
+        op = self._ops[i]
+        if op < 0:
+            return repr(self._consts[-op - 1])
+        return SYMBOLS[op]
+
+    def depth(self):
+        """Return the depth of the expression, as depth in charlemagne.lsp"""
+        args = self._args
+        stack = []
+        for i in range(len(args) - 1, -1, -1):
+            d = 0
+            for k in range(args[i]):
+                d = max(d, stack.pop() + 1)
+            stack.append(d)
+        if len(stack) == 0:
+            return 0
+        return stack[0]
+
+    def subtree(self, i):
+        """Return the subtree rooted at node i as a ProgramTree"""
+        end = self._ends[i]
+        ops = self._ops[i:end]
+        consts = array('d')
+        for k in range(len(ops)):
+            if ops[k] < 0:
+                consts.append(self._consts[-ops[k] - 1])
+                ops[k] = -len(consts)
+        return ProgramTree(ops, self._args[i:end], consts)
+
+    def replace(self, i, subtree):
+        """Return a copy of the tree with the subtree at node i replaced
+
+        The arrays are spliced together, so this takes time proportional to
+        the size of the result.
+        """
+        end = self._ends[i]
+        consts = array('d')
+        ops = array('i')
+        for source, start, stop in ((self, 0, i), (subtree, 0, len(subtree)),
+                                    (self, end, len(self))):
+            sourceops = source._ops ; sourceconsts = source._consts
+            for k in range(start, stop):
+                op = sourceops[k]
+                if op < 0:
+                    consts.append(sourceconsts[-op - 1])
+                    op = -len(consts)
+                ops.append(op)
+        args = self._args[:i] + subtree._args + self._args[end:]
+        return ProgramTree(ops, args, consts)
+
+    def path(self, i):
+        """Return the path from the root to node i, as tree-path in charlemagne.lsp
+
+        The path is a tuple of argument positions, 0 for the first argument
+        and 1 for the second.  It stops short of a node reached through a
+        third or later argument.
+        """
+        path = []
+        node = 0
+        while node <> i:
+            children = self.children(node)
+            k = len(children) - 1
+            while children[k] > i:
+                k = k - 1
+            if k > 1:
+                break
+            path.append(k)
+            node = children[k]
+        return tuple(path)
+
+    def find(self, path):
+        """Return the offset of the node at the end of a path, or None
+
+        None is returned where path-exists in charlemagne.lsp is false.
+        """
+        node = 0
+        for k in path:
+            if k >= self._args[node]:
+                return None
+            node = self.children(node)[k]
+        return node
+
+    def synthesizeConstants(self):
+        """Return a copy of the tree with each CONSTANT-SYNTHESIS terminal replaced by a random constant
+
+        The constants have an exponentially distributed magnitude and a
+        random sign.  They are all drawn at once, and the tree is rewritten
+        in a single pass.
+        """
+        synthesis = OPCODES.get(CONSTANT_SYNTHESIS)
+        if synthesis is None or synthesis not in self._ops:
+            return self
+        ops = array('i', self._ops) ; consts = array('d')
+        n = ops.count(synthesis)
+        values = iter(numpy.random.exponential(1.0, n) *
+                      numpy.random.choice((-1.0, 1.0), n))
+        for i in range(len(ops)):
+            op = ops[i]
+            if op < 0:
+                consts.append(self._consts[-op - 1])
+            elif op == synthesis:
+                consts.append(values.next())
+            else:
+                continue
+            ops[i] = -len(consts)
+        return ProgramTree(ops, array('B', self._args), consts)
+
+    def simplify(self):
+        """Return a copy of the tree with constant subtrees folded and identities applied
+
+        A function call on numbers is replaced by its value if the function
+        is one the expression module evaluates natively, with the semantics
+        of charlemagne.lsp, and the value is not an arithmetic error.  Then
+        (+ x 0), (+ 0 x), (- x 0), (* x 1), (* 1 x), (% x 1) and (- (- x))
+        become x, and (% x c) becomes (* x 1/c) where c is not too small for
+        the protected division.  No subtree which could cause an arithmetic
+        error is removed.
+        """
+        ops = self._ops ; args = self._args ; consts = self._consts
+        stack = []
+        for i in range(len(ops) - 1, -1, -1):
+            op = ops[i]
+            if op < 0:
+                stack.append(consts[-op - 1])
+            elif args[i] == 0:
+                value = atom(SYMBOLS[op])
+                if type(value) in (int, long):
+                    stack.append(value)
+                else:
+                    stack.append((op,))
+            else:
+                children = [stack.pop() for k in range(args[i])]
+                stack.append(_simplifyNode(op, children))
+        ops = array('i') ; args = array('B') ; consts = array('d')
+        pending = stack
+        while len(pending) > 0:
+            node = pending.pop()
+            if type(node) == tuple:
+                ops.append(node[0])
+                args.append(len(node) - 1)
+                pending.extend(reversed(node[1:]))
+            elif type(node) == float:
+                _append(ops, consts, repr(node))
+                args.append(0)
+            else:
+                _append(ops, consts, str(node))
+                args.append(0)
+        return ProgramTree(ops, args, consts)
+
+    def toLisp(self):
+        """Return the lisp expression as a string"""
+        if len(self._ops) == 0:
+            return "()"
+        args = self._args
+        tokens = []
+        pending = []
+        for i in range(len(args)):
+            if args[i] > 0:
+                tokens.append("(" + self.atom(i))
+                pending.append(args[i])
+                continue
+            tokens.append(self.atom(i))
+            while len(pending) > 0:
+                pending[-1] = pending[-1] - 1
+                if pending[-1] > 0:
+                    break
+                pending.pop()
+                tokens[-1] = tokens[-1] + ")"
+        return string.join(tokens, " ")
+
+    def __str__(self):
+        return self.toLisp()
+
+    def help(self):
+        help(type(self))
+
+def fromLisp(lisp):
+    """Encode a lisp expression string as a ProgramTree
+
+    Raises UnsupportedExpression for anything that is not an atom or a
+    function call on atoms and function calls.
+    """
+    ops = array('i') ; args = array('B') ; consts = array('d')
+    tokens = tokenize(lisp)
+    if tokens == ["(", ")"]:
+        return ProgramTree()
+    stack = []
+    head = 0
+    for token in tokens:
+        if token == "(":
+            if head or (len(stack) == 0 and len(ops) > 0):
+                raise UnsupportedExpression
+            if len(stack) > 0:
+                stack[-1][1] = stack[-1][1] + 1
+            head = 1
+        elif token == ")":
+            if head or len(stack) == 0:
+                raise UnsupportedExpression
+            i, n = stack.pop()
+            if n == 0 or n > 255:
+                raise UnsupportedExpression
+            args[i] = n
+        else:
+            a = atom(token)
+            if head:
+                if type(a) <> str:
+                    raise UnsupportedExpression
+                stack.append([len(ops), 0])
+                head = 0
+            elif len(stack) > 0:
+                stack[-1][1] = stack[-1][1] + 1
+            elif len(ops) > 0:
+                raise UnsupportedExpression
+            _append(ops, consts, token)
+            args.append(0)
+    if head or len(stack) > 0 or len(ops) == 0:
+        raise UnsupportedExpression
+    return ProgramTree(ops, args, consts)
+
+def _append(ops, consts, token):
+    a = atom(token)
+    if type(a) == float:
+        consts.append(a)
+        ops.append(-len(consts))
+    else:
+        ops.append(opcode(str(a)))
+
+def _isNumber(node):
+    return type(node) in (int, long, float)
+
+def _simplifyNode(op, children):
+    """Simplify a function call whose arguments have been simplified
+
+    Numbers stand for themselves, anything else is a tuple of an opcode
+    and its simplified arguments.
+    """
+    symbol = SYMBOLS[op]
+    numbers = filter(_isNumber, children)
+    if len(numbers) == len(children):
+        value = _fold(symbol, children)
+        if value is not None:
+            return value
+    if len(children) == 2:
+        a, b = children
+        if symbol in ("+", "-") and _isNumber(b) and b == 0:
+            return a
+        if symbol == "+" and _isNumber(a) and a == 0:
+            return b
+        if symbol == "*" and _isNumber(b) and b == 1:
+            return a
+        if symbol == "*" and _isNumber(a) and a == 1:
+            return b
+        if symbol == "%" and _isNumber(b) and not _isNumber(a):
+            if b == 1:
+                return a
+            if abs(b) * 10000000000 >= 1:
+                return (opcode("*"), a, 1.0 / b)
+    if len(children) == 1 and symbol == "-":
+        a = children[0]
+        if type(a) == tuple and len(a) == 2 and SYMBOLS[a[0]] == "-":
+            return a[1]
+    return (op,) + tuple(children)
+
+def _fold(symbol, numbers):
+    """Return the value of a function call on numbers, or None if it can't be folded"""
+    if len(numbers) == 1:
+        function = ONE_ARGUMENT_FUNCTIONS.get(symbol)
+    else:
+        function = TWO_ARGUMENT_FUNCTIONS.get(symbol)
+    if function is None:
+        return None
+    # lisp divides integers into ratios, which a constant can't express
+    if symbol in ("/", "%") and float not in map(type, numbers):
+        return None
+    try:
+        return checked(function(*numbers))
+    except (NaughtyExpression, OverflowError, ValueError, ZeroDivisionError):
+        return None
+
+def randomTree(maxdepth, terminals, onearg, twoarg):
+    """Create a random ProgramTree, as random-program in charlemagne.lsp
+
+    terminals, onearg and twoarg are lists of vocabulary tokens.  Below the
+    root each node is drawn from the whole vocabulary, except at maxdepth
+    where only terminals are drawn.
+    """
+    vocabulary = []
+    for token in terminals + onearg + twoarg:
+        if token in terminals:
+            vocabulary.append((token, 0))
+        elif token in onearg:
+            vocabulary.append((token, 1))
+        else:
+            vocabulary.append((token, 2))
+    choice = random.choice
+    ops = array('i') ; args = array('B') ; consts = array('d')
+    pending = [maxdepth]
+    while len(pending) > 0:
+        depth = pending.pop()
+        if depth <= 1:
+            token, n = choice(terminals), 0
+        else:
+            token, n = choice(vocabulary)
+        _append(ops, consts, token)
+        args.append(n)
+        pending.extend([depth - 1] * n)
+    return ProgramTree(ops, args, consts)
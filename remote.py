@@ -0,0 +1,236 @@
+"""
+Remote module
+
+This module is part of Charlemagne
+Copyright (c) Robert Green 2002, 2003
+
+Charlemagne is distributed under the GNU General Public License.  See
+the file LICENSE.txt in the distribution for details.
+
+A worker is started on each node with::
+
+    $ CHARLEMAGNE_SECRET=<secret> python remote.py [host:]port [CLISP|PYTHON]
+
+and the coordinating run, with the same CHARLEMAGNE_SECRET in its
+environment, is pointed at the workers with
+--fitness-evaluation REMOTE=host:port,host:port,...
+
+Workers evaluate the lisp they are sent, and lisp can run shell commands,
+so every request must carry the shared secret.  XML-RPC is not encrypted,
+though, so never expose a worker's port beyond a trusted network.
+"""
+
+import os
+import sys
+import hmac
+import socket
+import threading
+import itertools
+import Queue
+import xmlrpclib
+from SimpleXMLRPCServer import SimpleXMLRPCServer
+
+from interpreter import CLISPInterpreter
+from interpreter import PythonInterpreter
+
+# workers report this fault when asked to evaluate on fitness cases they do
+# not hold, such as after a restart
+UNKNOWN_DATASET = 1
+
+# workers report this fault when a request does not carry their secret
+UNAUTHORIZED = 2
+
+# the environment variable holding the secret shared by workers and the
+# coordinating run
+SECRET_VARIABLE = "CHARLEMAGNE_SECRET"
+
+_datasets = itertools.count()
+
+class FitnessWorker(object):
+    """Evaluates batches of expressions for a RemoteInterpreterPool
+
+    The worker holds one set of fitness cases resident, identified by a
+    dataset name chosen by the coordinator.  Every request must carry the
+    worker's secret.
+    """
+
+    __slots__ = ['_interpreter', '_secret', '_dataset', '_inputs', '_outputs']
+
+    def __init__(self, interpreter, secret):
+        self._interpreter = interpreter
+        self._secret = secret
+        self._dataset = None
+        self._inputs = None
+        self._outputs = None
+
+    def _authorize(self, secret):
+        if not hmac.compare_digest(str(secret), self._secret):
+            raise xmlrpclib.Fault(UNAUTHORIZED, "unauthorized")
+
+    def setFitnessCases(self, secret, dataset, inputs, outputs):
+        """Hold the fitness cases for a dataset, replacing any others"""
+        self._authorize(secret)
+        self._dataset = dataset
+        self._inputs = inputs
+        self._outputs = outputs
+        return 1
+
+    def evaluateBatch(self, secret, dataset, exprs, deviancefunction, precision):
+        """Calculate the fitness of a list of expressions on the held fitness cases
+
+        Returns the results of CLISPInterpreter.evaluateBatch.
+        """
+        self._authorize(secret)
+        if dataset <> self._dataset:
+            raise xmlrpclib.Fault(UNKNOWN_DATASET, "unknown dataset " + dataset)
+        return self._interpreter.evaluateBatch(exprs, self._inputs,
+                                               self._outputs, deviancefunction,
+                                               precision)
+
+    def loadFile(self, secret, filename):
+        """Load a lisp environment file into the interpreter"""
+        self._authorize(secret)
+        self._interpreter.evaluate('(load "' + _lispString(filename) + '")')
+        return 1
+
+def _lispString(s):
+    return s.replace('\\', '\\\\').replace('"', '\\"')
+
+def _secret(secret):
+    if secret is None:
+        secret = os.environ.get(SECRET_VARIABLE)
+    if not secret:
+        raise ValueError("the worker secret must be set in " + SECRET_VARIABLE)
+    return secret
+
+def serve(host, port, interpreterclass=CLISPInterpreter, secret=None):
+    """Serve a FitnessWorker with its own interpreter until interrupted
+
+    The secret defaults to the CHARLEMAGNE_SECRET environment variable,
+    and ValueError is raised if there is none.
+    """
+    secret = _secret(secret)
+    server = SimpleXMLRPCServer((host, port), allow_none=True,
+                                logRequests=False)
+    server.register_instance(FitnessWorker(interpreterclass(), secret))
+    server.serve_forever()
+
+class RemoteInterpreterPool(object):
+    """A pool of remote FitnessWorkers which evaluates batches of expressions in parallel
+
+    This works like an InterpreterPool, but the interpreters are worker
+    processes reached over XML-RPC, on this machine or others.  Fitness
+    cases are sent to the workers only when they change.
+    """
+
+    __slots__ = ['_addresses', '_secret', '_inputs', '_outputs', '_cases',
+                 '_dataset', '_sent']
+
+    def __init__(self, addresses, secret=None):
+        """Create a pool of the workers at a list of host:port addresses
+
+        The secret shared with the workers defaults to the
+        CHARLEMAGNE_SECRET environment variable, and ValueError is raised
+        if there is none.
+        """
+        self._addresses = addresses
+        self._secret = _secret(secret)
+        self._inputs = None
+        self._outputs = None
+        self._cases = None
+        self._dataset = None
+        self._sent = {}
+
+    def __len__(self):
+        return len(self._addresses)
+
+    def _proxy(self, address):
+        return xmlrpclib.ServerProxy("http://" + address, allow_none=True)
+
+    def loadFile(self, filename):
+        """Load a lisp environment file into every worker in the pool
+
+        The file must be at the same path on every worker's machine.
+        """
+        for address in self._addresses:
+            self._proxy(address).loadFile(self._secret, filename)
+
+    def _setFitnessCases(self, inputs, outputs):
+        if inputs is self._inputs and outputs is self._outputs:
+            return
+        self._inputs = inputs
+        self._outputs = outputs
+        # plain lists of floats, for marshalling
+        rows = [map(float, vector) for vector in inputs]
+        if outputs is not None:
+            outputs = map(float, outputs)
+        self._cases = (rows, outputs)
+        self._dataset = "%s:%d:%d" % (socket.gethostname(), os.getpid(),
+                                      _datasets.next())
+
+    def evaluateBatch(self, exprs, inputs, outputs=None, deviancefunction=None,
+                      precision=0.01):
+        """Calculate the fitness of a list of expressions across the pool
+
+        Takes the same arguments and returns the same results as
+        CLISPInterpreter.evaluateBatch.
+        """
+        self._setFitnessCases(inputs, outputs)
+        dataset = self._dataset
+        chunksize = max(1, len(exprs) / (len(self._addresses) * 4))
+        chunks = Queue.Queue()
+        for start in range(0, len(exprs), chunksize):
+            chunks.put(start)
+        results = [None] * len(exprs)
+        errors = []
+        def work(address):
+            try:
+                proxy = self._proxy(address)
+                while 1:
+                    try:
+                        start = chunks.get_nowait()
+                    except Queue.Empty:
+                        break
+                    end = start + chunksize
+                    if self._sent.get(address) <> dataset:
+                        proxy.setFitnessCases(self._secret, dataset,
+                                              self._cases[0], self._cases[1])
+                        self._sent[address] = dataset
+                    try:
+                        batch = proxy.evaluateBatch(self._secret, dataset,
+                                                    exprs[start:end],
+                                                    deviancefunction, precision)
+                    except xmlrpclib.Fault, fault:
+                        if fault.faultCode <> UNKNOWN_DATASET:
+                            raise
+                        proxy.setFitnessCases(self._secret, dataset,
+                                              self._cases[0], self._cases[1])
+                        batch = proxy.evaluateBatch(self._secret, dataset,
+                                                    exprs[start:end],
+                                                    deviancefunction, precision)
+                    results[start:end] = [tuple(result) for result in batch]
+            except:
+                errors.append(sys.exc_info())
+        threads = []
+        for address in self._addresses:
+            thread = threading.Thread(target=work, args=(address,))
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        if len(errors) > 0:
+            raise errors[0][0], errors[0][1], errors[0][2]
+        return results
+
+if __name__ == "__main__":
+    address = sys.argv[1].split(':')
+    if len(address) == 1:
+        address = ["localhost"] + address
+    if len(sys.argv) > 2 and sys.argv[2] == "PYTHON":
+        interpreterclass = PythonInterpreter
+    else:
+        interpreterclass = CLISPInterpreter
+    try:
+        serve(address[0], int(address[1]), interpreterclass)
+    except ValueError, e:
+        sys.exit(str(e))
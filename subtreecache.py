@@ -0,0 +1,163 @@
+"""
+Subtree cache module
+
+This module is part of Charlemagne
+Copyright (c) Robert Green 2002, 2003
+
+Charlemagne is distributed under the GNU General Public License.  See
+the file LICENSE.txt in the distribution for details.
+"""
+
+from collections import OrderedDict
+import numpy
+
+from exception import NaughtyExpression
+from exception import UnsupportedExpression
+from expression import atom
+from expression import inputIndex
+from expression import columnChecked
+from expression import CONSTANTS
+from expression import COLUMN_ONE_ARGUMENT_FUNCTIONS
+from expression import COLUMN_TWO_ARGUMENT_FUNCTIONS
+from programtree import SYMBOLS
+
+# the cached result of subtrees which cause an arithmetic error
+NAUGHTY = "NAUGHTY"
+
+# the number of distinct subtrees remembered before starting afresh
+IDENTITY_LIMIT = 1000000
+
+class SubtreeCache(object):
+    """Evaluates ProgramTrees over the input columns, sharing the results of common subtrees
+
+    Subtrees are hash-consed: each distinct subtree gets an id made from its
+    operator and the ids of its arguments, so a subtree shared by many
+    programs has the same id wherever it appears, and its column of results
+    is calculated once.  Results are kept in a table bounded by a memory
+    budget in bytes, discarding the least recently used.
+    """
+
+    __slots__ = ['_budget', '_bytes', '_ids', '_results', '_hits', '_misses']
+
+    def __init__(self, budget):
+        self._budget = budget
+        self._bytes = 0
+        self._ids = {}
+        self._results = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def __len__(self):
+        return len(self._results)
+
+    def clear(self):
+        """Forget all subtrees and their results"""
+        self._bytes = 0
+        self._ids.clear()
+        self._results.clear()
+
+    def getHits(self):
+        """Returns the number of subtrees whose result was found in the cache"""
+        return self._hits
+
+    def getMisses(self):
+        """Returns the number of subtrees which had to be calculated"""
+        return self._misses
+
+    def _identify(self, key):
+        ids = self._ids
+        try:
+            return ids[key]
+        except KeyError:
+            ids[key] = len(ids)
+            return ids[key]
+
+    def _store(self, id, value):
+        results = self._results
+        results[id] = value
+        if isinstance(value, numpy.ndarray):
+            self._bytes += value.nbytes
+            while self._bytes > self._budget and len(results) > 1:
+                old = results.popitem(last=False)[1]
+                if isinstance(old, numpy.ndarray):
+                    self._bytes -= old.nbytes
+
+    def evaluate(self, tree, columns):
+        """Return the values of a ProgramTree for every input as an array
+
+        columns is a sequence of numpy arrays, one per input dimension.
+        Raises NaughtyExpression as compileColumnExpression would, and
+        UnsupportedExpression if the tree uses anything which is not
+        available natively.
+        """
+        if len(self._ids) > IDENTITY_LIMIT:
+            self.clear()
+        errors = numpy.seterr(all='ignore')
+        try:
+            try:
+                y = self._evaluate(tree, columns)
+            except (OverflowError, ValueError, ZeroDivisionError):
+                raise NaughtyExpression
+        finally:
+            numpy.seterr(**errors)
+        return y + numpy.zeros(len(columns[0]))
+
+    def _evaluate(self, tree, columns):
+        ops = tree.getOps() ; args = tree.getArgs() ; consts = tree.getConsts()
+        results = self._results ; identify = self._identify
+        if len(ops) == 0:
+            raise UnsupportedExpression
+        stack = []
+        for i in range(len(ops) - 1, -1, -1):
+            op = ops[i]
+            if args[i] == 0:
+                if op < 0:
+                    value = consts[-op - 1]
+                    stack.append((identify(('CONSTANT', value)), value))
+                else:
+                    stack.append((identify(('SYMBOL', op)),
+                                  _leaf(SYMBOLS[op], columns)))
+                continue
+            if args[i] == 1:
+                arguments = (stack.pop(),)
+                functions = COLUMN_ONE_ARGUMENT_FUNCTIONS
+            elif args[i] == 2:
+                arguments = (stack.pop(), stack.pop())
+                functions = COLUMN_TWO_ARGUMENT_FUNCTIONS
+            else:
+                raise UnsupportedExpression
+            id = identify((op,) + tuple([a[0] for a in arguments]))
+            value = results.pop(id, None)
+            if value is None:
+                self._misses += 1
+                try:
+                    function = functions[SYMBOLS[op]]
+                except KeyError:
+                    raise UnsupportedExpression
+                try:
+                    value = columnChecked(function(*[a[1] for a in arguments]))
+                except (NaughtyExpression, OverflowError, ValueError,
+                        ZeroDivisionError):
+                    self._store(id, NAUGHTY)
+                    raise NaughtyExpression
+                self._store(id, value)
+            else:
+                self._hits += 1
+                results[id] = value
+                if value is NAUGHTY:
+                    raise NaughtyExpression
+            stack.append((id, value))
+        return stack[0][1]
+
+def _leaf(symbol, columns):
+    if CONSTANTS.has_key(symbol):
+        return CONSTANTS[symbol]
+    i = inputIndex(symbol)
+    if i >= 0:
+        if i >= len(columns):
+            raise UnsupportedExpression
+        return columns[i]
+    value = atom(symbol)
+    if type(value) == str:
+        raise UnsupportedExpression
+    return value